@@ -0,0 +1,145 @@
+# Nome do arquivo: farm_cassete.py
+# (Gravação/reprodução das respostas HTTP do FarmCommand)
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Só estes cabeçalhos são gravados: cookies e tokens de sessão nunca vão para o cassete
+CABECALHOS_GRAVADOS = ('Content-Type',)
+
+
+def _chave_requisicao(method: str, url: str, body) -> str:
+    # Normaliza a URL (query ordenada) para que a ordem dos parâmetros não mude a chave
+    partes = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(partes.query, keep_blank_values=True)))
+    url_normalizada = urlunsplit((partes.scheme, partes.netloc, partes.path, query, ''))
+    if isinstance(body, str): body = body.encode('utf-8')
+    h = hashlib.sha1(f"{method.upper()} {url_normalizada}\n".encode('utf-8'))
+    h.update(body or b'')
+    return h.hexdigest()
+
+
+class CasseteHTTP:
+    """
+    Arquivo .zip (compactado e indexado) com as respostas autenticadas recebidas
+    pelo RelatorioClimaCompleto: 'index.json' mapeia a chave de cada requisição
+    (método + URL + corpo) para os corpos gravados em 'respostas/<n>.bin'.
+    Os corpos vão direto para o zip (gravação) e são lidos sob demanda (reprodução),
+    sem manter todo o JSON bruto em memória.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.indice = {}
+        self.metadados = {}
+        self.modo = None  # 'gravar' | 'reproduzir'
+        self._zip = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    # --- Gravação ---
+    def instrumentar(self, session: requests.Session) -> requests.Session:
+        with self._lock:
+            if self._zip is None:
+                self.modo = 'gravar'
+                self._zip = zipfile.ZipFile(self.caminho, 'w', compression=zipfile.ZIP_DEFLATED)
+        if self._gravar_resposta not in session.hooks['response']:
+            session.hooks['response'].append(self._gravar_resposta)
+        return session
+
+    def _gravar_resposta(self, response: requests.Response, *args, **kwargs):
+        req = response.request
+        chave = _chave_requisicao(req.method, req.url, req.body)
+        with self._lock:
+            nome = f"respostas/{self._total}.bin"
+            self._zip.writestr(nome, response.content)
+            self._total += 1
+            self.indice.setdefault(chave, []).append({
+                'method': req.method, 'url': req.url, 'status': response.status_code,
+                'headers': {k: response.headers[k] for k in CABECALHOS_GRAVADOS if k in response.headers},
+                'arquivo': nome,
+            })
+        return response
+
+    def salvar(self):
+        # O índice vai por último: os corpos já foram escritos à medida que chegaram
+        with self._lock:
+            if self._zip is None: return
+            self._zip.writestr('index.json', json.dumps({'metadados': self.metadados, 'indice': self.indice}, indent=1))
+            self._zip.close()
+            self._zip = None
+        print(f"--- [farm_cassete] {self._total} respostas gravadas em '{self.caminho}' ({os.path.getsize(self.caminho) / 1024:.0f} KB) ---")
+
+    # --- Reprodução ---
+    @classmethod
+    def carregar(cls, caminho: str) -> "CasseteHTTP":
+        cassete = cls(caminho)
+        cassete.modo = 'reproduzir'
+        cassete._zip = zipfile.ZipFile(caminho, 'r')
+        dados = json.loads(cassete._zip.read('index.json'))
+        cassete.metadados = dados.get('metadados', {})
+        cassete.indice = dados.get('indice', {})
+        total = sum(len(v) for v in cassete.indice.values())
+        print(f"--- [farm_cassete] {total} respostas carregadas de '{caminho}' ---")
+        return cassete
+
+    def ler_corpo(self, nome: str) -> bytes:
+        with self._lock:
+            return self._zip.read(nome)
+
+    def criar_sessao_replay(self, latencia: float = 0.0) -> requests.Session:
+        s = requests.Session()
+        adaptador = AdaptadorReplay(self, latencia)
+        s.mount('https://', adaptador)
+        s.mount('http://', adaptador)
+        return s
+
+
+class AdaptadorReplay(BaseAdapter):
+    """
+    Transporte em processo: responde a partir do cassete, sem rede.
+    Requisições repetidas recebem as respostas na ordem em que foram gravadas.
+    'latencia' (segundos) simula o tempo de rede por requisição.
+    """
+
+    def __init__(self, cassete: CasseteHTTP, latencia: float = 0.0):
+        super().__init__()
+        self.cassete = cassete
+        self.latencia = latencia
+        self._proxima = {}
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        chave = _chave_requisicao(request.method, request.url, request.body)
+        gravadas = self.cassete.indice.get(chave)
+        if not gravadas:
+            raise requests.exceptions.ConnectionError(f"[farm_cassete] Requisição não gravada no cassete: {request.method} {request.url}", request=request)
+        with self._lock:
+            i = self._proxima.get(chave, 0)
+            self._proxima[chave] = i + 1
+        gravada = gravadas[min(i, len(gravadas) - 1)]
+
+        if self.latencia: time.sleep(self.latencia)
+
+        response = requests.Response()
+        response.status_code = gravada['status']
+        response.headers = CaseInsensitiveDict(gravada['headers'])
+        response._content = self.cassete.ler_corpo(gravada['arquivo'])
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if response.status_code < 400 else 'Replay'
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
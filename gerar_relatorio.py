@@ -6,6 +6,9 @@ import time
 from datetime import datetime, timedelta
 import os
 import sys
+import queue
+import heapq
+import threading
 
 # --- Importa a função de login ---
 try:
@@ -15,6 +18,9 @@ except ImportError:
     print("    Certifique-se de que 'farm_auth.py' está na mesma pasta que este script.")
     sys.exit(1)
 
+from servidor_agregacao import AgregadorEstacaoDia, iniciar_servidor_local
+from farm_cassete import CasseteHTTP
+
 # ============================================================================
 # --- CONFIGURAÇÃO DO CLIENTE (CLAYTON) ---
 # ============================================================================
@@ -29,12 +35,71 @@ ESTACOES_DO_CLIENTE = [
 ]
 ANOS_DE_HISTORICO = 2
 
+# --- Retenção em camadas (opcional) ---
+# Últimos MESES_RESOLUCAO_HORARIA meses em resolução horária, até ANOS_RESOLUCAO_DIARIA
+# anos em agregados diários e o restante (até ANOS_DE_HISTORICO) em agregados mensais.
+# Exige MESES_RESOLUCAO_HORARIA < 12 * ANOS_RESOLUCAO_DIARIA e ANOS_RESOLUCAO_DIARIA < ANOS_DE_HISTORICO.
+# As camadas diária/mensal são calculadas uma única vez e congeladas em DIRETORIO_ARMAZENAMENTO.
+# Ative com RETENCAO_EM_CAMADAS = True ou rodando: python gerar_relatorio.py --camadas
+RETENCAO_EM_CAMADAS = False
+MESES_RESOLUCAO_HORARIA = 6
+ANOS_RESOLUCAO_DIARIA = 1
+DIRETORIO_ARMAZENAMENTO = "armazenamento_local"
+AGREGACAO_CAMADAS = {
+    'precipitacao_mm': 'sum', 'radiacao_solar': 'sum',
+    'temp_media_c': 'mean', 'temp_min_c': 'min', 'temp_max_c': 'max',
+    'umidade_media_perc': 'mean', 'umidade_min_perc': 'min', 'umidade_max_perc': 'max',
+    'vento_medio_kph': 'mean', 'rajada_max_kph': 'max', 'delta_t': 'mean', 'gfdi': 'mean',
+}
+
+# --- Cassete HTTP (gravação/reprodução offline) ---
+# 'gravar': salva todas as respostas autenticadas em ARQUIVO_CASSETE
+# 'reproduzir': roda sem credenciais nem rede, servindo as respostas do cassete
+# Também pode ser ativado rodando: python gerar_relatorio.py --gravar | --reproduzir
+MODO_CASSETE = None
+ARQUIVO_CASSETE = "cassete_farmcommand.zip"
+LATENCIA_REPLAY_SEGUNDOS = 0.0
+
+# --- Pipeline de ingestão ---
+# Máximo de blocos de 60 dias (JSON bruto) aguardando processamento em memória
+TAMANHO_FILA_PIPELINE = 4
+
+# --- Geometria dos talhões ---
+# Tolerância do Douglas-Peucker em graus (0.00001° ~ 1,1 m), casas decimais das coordenadas
+# e codificação opcional em inteiros delta (primeiro ponto absoluto, demais como diferença)
+TOLERANCIA_SIMPLIFICACAO_GRAUS = 0.00001
+CASAS_DECIMAIS_COORDENADAS = 6
+CODIFICAR_GEOMETRIA_DELTA = False
+
+# --- Limites da janela de pulverização (vento em km/h, Delta T em °C) ---
+# Ideal: vento e Delta T dentro das faixas; Evitar: acima dos limites; demais: Atenção
+LIMITES_PULVERIZACAO = {
+    'vento_min': 2, 'vento_max_ideal': 8, 'vento_max': 9,
+    'delta_t_min': 2, 'delta_t_max': 10,
+}
+CONDICOES_PULVERIZACAO = ['Ideal', 'Atenção', 'Evitar', 'NoData']
+
+# --- Modo de memória compacta (opcional) ---
+# Estações como 'category', métricas em float32 e horário local com fuso real.
+# Ative com MODO_MEMORIA_COMPACTA = True ou rodando: python gerar_relatorio.py --compacto
+MODO_MEMORIA_COMPACTA = False
+FUSO_HORARIO_LOCAL = "America/Cuiaba"
+
+# --- Servidor local de agregação (opcional) ---
+# Ative com MODO_SERVIDOR_LOCAL = True ou rodando: python gerar_relatorio.py --servir
+MODO_SERVIDOR_LOCAL = False
+HOST_SERVIDOR_LOCAL = "127.0.0.1"
+PORTA_SERVIDOR_LOCAL = 8765
+
 
 # ============================================================================
 
 class RelatorioClimaCompleto:
-    def __init__(self, grower_id: int, grower_name: str, stations: list, session: requests.Session):
+    def __init__(self, grower_id: int, grower_name: str, stations: list, session: requests.Session, compacto: bool = False, camadas: bool = False, cassete: CasseteHTTP | None = None):
         self.session = session 
+        self.cassete = cassete
+        self.modo_compacto = compacto
+        self.retencao_em_camadas = camadas
         self.weather_url_base = "https://admin.farmcommand.com/weather/{}/historical-summary-hourly/"
         self.assets_url = "https://admin.farmcommand.com/asset/?season=1083"
         self.field_border_url = "https://admin.farmcommand.com/fieldborder/?assetID={}&format=json"
@@ -42,6 +107,9 @@ class RelatorioClimaCompleto:
         self.hourly_forecast_url = "https://admin.farmcommand.com/weather/wsi/hourly-forecast/"
 
         self.stations_info = stations
+        # Categorias fixas para que o pd.concat das estações preserve o dtype 'category'
+        self._dtype_nome_estacao = pd.CategoricalDtype([s.get('name', f"ID {s['id_estacao']}") for s in stations])
+        self._dtype_station_id = pd.CategoricalDtype([s['id_estacao'] for s in stations])
         self.grower_name_cache = {grower_id: grower_name}
         self.target_grower_id = grower_id
 
@@ -75,9 +143,12 @@ class RelatorioClimaCompleto:
         except requests.exceptions.RequestException as e:
             print(f" -> Erro de requisição para {url}: {e}.")
             if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code in [401, 403]:
+                if self.cassete and self.cassete.modo == 'reproduzir':
+                    return None  # reprodução é offline: nunca tenta login de verdade
                 print("Sessão expirada. Tentando re-autenticar...")
                 self.session = get_authenticated_session()
                 if self.session:
+                    if self.cassete: self.cassete.instrumentar(self.session)
                     return self._make_request(url, params)
             return None
 
@@ -98,19 +169,161 @@ class RelatorioClimaCompleto:
                 field_info = next((item for item in all_assets if item["id"] == field_id), None)
                 shape_data = json.loads(border_data[0]["shapeData"])
                 geom = shape_data.get('features', [{}])[0].get('geometry', shape_data)
-                coords_raw = []
-                if geom.get('type') == 'Polygon': coords_raw = geom.get('coordinates', [[]])[0]
-                elif geom.get('type') == 'MultiPolygon': coords_raw = geom.get('coordinates', [[[]]])[0][0]
-                coords_leaflet = [[c[1], c[0]] for c in coords_raw]
-                if coords_leaflet:
-                    all_borders.append({'field_id': field_id, 'field_name': field_info['label'] if field_info else f"Talhão {field_id}", 'centroid': [border_data[0]["centroid_lat"], border_data[0]["centroid_lon"]], 'geometry': {'type': 'Polygon', 'coordinates': [coords_leaflet]}})
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
+                geometry = self._processar_geometria(geom)
+                if geometry:
+                    all_borders.append({'field_id': field_id, 'field_name': field_info['label'] if field_info else f"Talhão {field_id}", 'centroid': [border_data[0]["centroid_lat"], border_data[0]["centroid_lon"]], 'geometry': geometry})
+            except (json.JSONDecodeError, KeyError, IndexError, TypeError) as e:
                 print(f" -> Falha ao processar borda para o talhão ID {field_id}: {e}")
         print(f"Encontrados {len(all_borders)} talhões.")
         return all_borders
 
-    def buscar_dados_climaticos(self, station_id: str, start_date: str, end_date: str) -> list:
-        all_results = []
+    def _douglas_peucker(self, pontos: list, tolerancia: float) -> list:
+        # Versão iterativa (pilha) para não estourar a recursão em bordas muito detalhadas
+        if len(pontos) < 3: return list(pontos)
+        manter = [False] * len(pontos)
+        manter[0] = manter[-1] = True
+        pilha = [(0, len(pontos) - 1)]
+        while pilha:
+            ini, fim = pilha.pop()
+            (ax, ay), (bx, by) = pontos[ini], pontos[fim]
+            dx, dy = bx - ax, by - ay
+            norma = (dx * dx + dy * dy) ** 0.5
+            dist_max, idx_max = 0.0, None
+            for i in range(ini + 1, fim):
+                px, py = pontos[i]
+                if norma == 0: dist = ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+                else: dist = abs(dy * px - dx * py + bx * ay - by * ax) / norma
+                if dist > dist_max: dist_max, idx_max = dist, i
+            if idx_max is not None and dist_max > tolerancia:
+                manter[idx_max] = True
+                pilha.append((ini, idx_max))
+                pilha.append((idx_max, fim))
+        return [p for p, m in zip(pontos, manter) if m]
+
+    def _ha_cruzamento(self, aneis: list, apenas_primeiro_com_outros: bool = False) -> bool:
+        """
+        Varredura em x: só compara segmentos cujas caixas envolventes se sobrepõem.
+        Com apenas_primeiro_com_outros, testa só o anel aneis[0] contra os demais
+        (os cruzamentos internos de cada anel e entre os outros são ignorados).
+        """
+        def orientacao(a, b, c):
+            v = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+            return (v > 0) - (v < 0)
+        segmentos = [(r, i, len(anel), anel[i], anel[(i + 1) % len(anel)]) for r, anel in enumerate(aneis) for i in range(len(anel))]
+        segmentos.sort(key=lambda seg: min(seg[3][0], seg[4][0]))
+        ativos, expiracao = {}, []
+        for k, (r, i, n, a, b) in enumerate(segmentos):
+            x_min = min(a[0], b[0])
+            while expiracao and expiracao[0][0] < x_min:
+                ativos.pop(heapq.heappop(expiracao)[1], None)
+            y_min, y_max = min(a[1], b[1]), max(a[1], b[1])
+            for r2, j, c, d in ativos.values():
+                if apenas_primeiro_com_outros:
+                    if r == r2 or (r != 0 and r2 != 0): continue
+                elif r == r2 and abs(i - j) in (1, n - 1): continue  # segmentos vizinhos (inclusive pelo fechamento do anel)
+                if max(c[1], d[1]) < y_min or min(c[1], d[1]) > y_max: continue
+                if orientacao(a, b, c) * orientacao(a, b, d) < 0 and orientacao(c, d, a) * orientacao(c, d, b) < 0:
+                    return True
+            ativos[k] = (r, i, a, b)
+            heapq.heappush(expiracao, (max(a[0], b[0]), k))
+        return False
+
+    def _anel_tem_autointersecao(self, anel: list) -> bool:
+        return self._ha_cruzamento([anel])
+
+    def _ponto_no_anel(self, ponto: tuple, anel: list) -> bool:
+        x, y = ponto
+        dentro = False
+        for (x1, y1), (x2, y2) in zip(anel, anel[1:] + anel[:1]):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                dentro = not dentro
+        return dentro
+
+    def _normalizar_anel(self, anel: list) -> list:
+        # Anel sem o ponto de fechamento repetido (o Leaflet fecha o polígono sozinho)
+        pontos = [tuple(p[:2]) for p in anel]
+        if len(pontos) > 1 and pontos[0] == pontos[-1]: pontos = pontos[:-1]
+        return pontos
+
+    def _simplificar_anel(self, anel: list, tolerancia: float, outros_aneis: list = (), furos: list = ()) -> list:
+        """
+        Douglas-Peucker no anel, reduzindo a tolerância até o resultado não se cruzar,
+        não cruzar os outros anéis do talhão e (para o contorno externo) continuar contendo os furos.
+        """
+        pontos = self._normalizar_anel(anel)
+        if len(pontos) < 3: return []
+        outros_aneis = [a for a in outros_aneis if len(a) >= 2]
+
+        # Divide o anel no ponto mais distante do primeiro para simplificar duas polilinhas abertas
+        x0, y0 = pontos[0]
+        k = max(range(len(pontos)), key=lambda i: (pontos[i][0] - x0) ** 2 + (pontos[i][1] - y0) ** 2)
+        # Bordas de GPS ruidosas já podem vir se cruzando: nesse caso não há topologia a preservar
+        verificar_topologia = not self._anel_tem_autointersecao(pontos)
+        tol = tolerancia
+        while tol > 0 and k > 0:
+            primeira = self._douglas_peucker(pontos[:k + 1], tol)
+            segunda = self._douglas_peucker(pontos[k:] + [pontos[0]], tol)
+            simplificado = primeira[:-1] + segunda[:-1]
+            # Preserva a topologia: se o anel degenerou, passou a se cruzar, cruzou outro anel
+            # ou deixou um furo de fora, reduz a tolerância
+            if (len(simplificado) >= 3
+                    and not (verificar_topologia and self._anel_tem_autointersecao(simplificado))
+                    and not (outros_aneis and self._ha_cruzamento([simplificado] + outros_aneis, apenas_primeiro_com_outros=True))
+                    and all(self._ponto_no_anel(furo[0], simplificado) for furo in furos if furo)):
+                return simplificado
+            tol = tol / 2 if tol > tolerancia / 64 else 0
+        return pontos
+
+    def _quantizar_anel(self, anel: list) -> list:
+        # [lon, lat] -> [lat, lon] (ordem do Leaflet) arredondado, sem pontos repetidos em sequência
+        quantizado = []
+        for lon, lat in anel:
+            ponto = [round(lat, CASAS_DECIMAIS_COORDENADAS), round(lon, CASAS_DECIMAIS_COORDENADAS)]
+            if not quantizado or ponto != quantizado[-1]: quantizado.append(ponto)
+        return quantizado
+
+    def _codificar_anel_delta(self, anel: list) -> list:
+        escala = 10 ** CASAS_DECIMAIS_COORDENADAS
+        inteiros = [[round(lat * escala), round(lon * escala)] for lat, lon in anel]
+        return inteiros[:1] + [[p[0] - q[0], p[1] - q[1]] for q, p in zip(inteiros, inteiros[1:])]
+
+    def _processar_geometria(self, geom: dict) -> dict | None:
+        """
+        Converte Polygon/MultiPolygon (GeoJSON, [lon, lat]) em MultiPolygon para o Leaflet,
+        mantendo todas as partes e furos, simplificando e quantizando cada anel.
+        """
+        if geom.get('type') == 'Polygon': poligonos = [geom.get('coordinates', [])]
+        elif geom.get('type') == 'MultiPolygon': poligonos = geom.get('coordinates', [])
+        else: return None
+
+        # Cada anel é simplificado contra a versão atual de todos os outros anéis do talhão
+        # (já simplificados ou ainda originais), então o resultado final não tem cruzamentos novos entre eles
+        atuais = [[self._normalizar_anel(anel) for anel in poligono] for poligono in poligonos]
+        partes = []
+        for p, poligono in enumerate(atuais):
+            aneis = []
+            for i, anel in enumerate(poligono):
+                outros = [a for q, pol in enumerate(atuais) for j, a in enumerate(pol) if (q, j) != (p, i)]
+                furos_contidos = [furo for furo in poligono[1:] if furo and self._ponto_no_anel(furo[0], anel)] if i == 0 else []
+                simplificado = self._simplificar_anel(anel, TOLERANCIA_SIMPLIFICACAO_GRAUS, outros, furos_contidos)
+                atuais[p][i] = simplificado
+                anel_final = self._quantizar_anel(simplificado)
+                if len(anel_final) < 3:
+                    if i == 0: break  # contorno externo inválido descarta a parte inteira
+                    continue
+                aneis.append(self._codificar_anel_delta(anel_final) if CODIFICAR_GEOMETRIA_DELTA else anel_final)
+            if aneis: partes.append(aneis)
+        if not partes: return None
+
+        geometry = {'type': 'MultiPolygon', 'coordinates': partes}
+        if CODIFICAR_GEOMETRIA_DELTA:
+            geometry['encoding'] = 'delta'
+            geometry['scale'] = 10 ** CASAS_DECIMAIS_COORDENADAS
+        return geometry
+
+    def _iterar_blocos_climaticos(self, station_id: str, start_date: str, end_date: str):
+        # Gera (inicio, fim, resultados) de cada bloco de 60 dias assim que a resposta chega;
+        # resultados = None quando o bloco falhou
         start_dt = datetime.strptime(start_date, '%Y-%m-%d')
         end_dt = datetime.strptime(end_date, '%Y-%m-%d')
         current_dt = start_dt
@@ -126,14 +339,64 @@ class RelatorioClimaCompleto:
             params = {'startDate': api_start, 'endDate': api_end, 'format': 'json'}
             json_data = self._make_request(url, params=params)
             
-            if json_data and 'results' in json_data:
-                all_results.extend(json_data['results'])
+            yield api_start[:10], api_end[:10], (json_data['results'] if json_data and 'results' in json_data else None)
             
             time.sleep(0.1)
             current_dt = chunk_end_dt + timedelta(days=1)
-            
-        print(f"--- Busca para a estação {station_id} concluída. {len(all_results)} registros horários encontrados. ---")
-        return all_results
+
+    def buscar_e_processar_em_pipeline(self, stations: list, start_date: str, end_date: str) -> tuple[dict, dict]:
+        """
+        Produtor/consumidor: a thread principal baixa os blocos de 60 dias e os
+        coloca numa fila limitada (TAMANHO_FILA_PIPELINE); uma thread de trabalho
+        converte cada bloco em DataFrame enquanto o próximo ainda está sendo baixado.
+        A fila cheia bloqueia o download, limitando o JSON bruto em memória.
+        Retorna ({station_id: DataFrame} já ordenado por datetime,
+        {station_id: [(inicio, fim), ...]} com os blocos cujo download falhou).
+        """
+        fila = queue.Queue(maxsize=TAMANHO_FILA_PIPELINE)
+        lotes = {station['id_estacao']: [] for station in stations}
+        falhas = {}
+        erros = []
+
+        def consumidor():
+            while True:
+                item = fila.get()
+                if item is None: break
+                if erros: continue  # após uma falha só esvazia a fila para não travar o produtor
+                station_id, station_name, bloco = item
+                try:
+                    df_lote = self.processar_para_dataframe(bloco, station_id, station_name)
+                    if not df_lote.empty: lotes[station_id].append(df_lote)
+                except Exception as e:
+                    erros.append(e)
+
+        worker = threading.Thread(target=consumidor, name="pipeline-processamento", daemon=True)
+        worker.start()
+        try:
+            for station in stations:
+                station_id = station['id_estacao']
+                station_name = station.get('name', f"ID {station_id}")
+                total = 0
+                for bloco_ini, bloco_fim, bloco in self._iterar_blocos_climaticos(station_id, start_date, end_date):
+                    if erros: break
+                    if bloco is None:
+                        falhas.setdefault(station_id, []).append((bloco_ini, bloco_fim))
+                        continue
+                    total += len(bloco)
+                    if bloco: fila.put((station_id, station_name, bloco))
+                print(f"--- Busca para a estação {station_id} concluída. {total} registros horários encontrados. ---")
+                if station_id in falhas:
+                    print(f"AVISO: {len(falhas[station_id])} bloco(s) da estação {station_id} falharam: " + ", ".join(f"{a} a {b}" for a, b in falhas[station_id]))
+        finally:
+            fila.put(None)
+            worker.join()
+        if erros: raise erros[0]
+
+        resultado = {}
+        for station_id, dfs in lotes.items():
+            if dfs:
+                resultado[station_id] = pd.concat(dfs, ignore_index=True).sort_values('datetime', kind='stable').reset_index(drop=True)
+        return resultado, falhas
 
     def buscar_previsao_clima(self, lat: float, lon: float) -> list:
         data = {"lat": lat, "lon": lon, "unit": "m"}
@@ -230,7 +493,11 @@ class RelatorioClimaCompleto:
         
         # --- CORREÇÃO DE FUSO HORÁRIO (MATO GROSSO UTC-4) ---
         # Subtrai 4 horas do horário UTC para alinhar com o horário local real
-        df['datetime'] = df['datetime'] - pd.Timedelta(hours=4)
+        # (no modo compacto a coluna fica com o fuso local de verdade)
+        if self.modo_compacto:
+            df['datetime'] = df['datetime'].dt.tz_convert(FUSO_HORARIO_LOCAL)
+        else:
+            df['datetime'] = df['datetime'] - pd.Timedelta(hours=4)
         
         df = df.dropna(subset=['datetime']).sort_values('datetime')
         
@@ -255,13 +522,303 @@ class RelatorioClimaCompleto:
         
         df['nome_estacao'] = station_name
         df['station_id'] = station_id
+        if self.modo_compacto:
+            df = self._compactar_dataframe(df)
         return df
 
-    def gerar_html_final(self, df: pd.DataFrame, geodata: dict, all_forecasts: dict):
+    def _compactar_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        metricas = df.columns.difference(['datetime', 'nome_estacao', 'station_id'])
+        df = df.astype({col: np.float32 for col in metricas})
+        df['nome_estacao'] = df['nome_estacao'].astype(self._dtype_nome_estacao)
+        df['station_id'] = df['station_id'].astype(self._dtype_station_id)
+        return df.reset_index(drop=True)
+
+    def relatorio_memoria(self, df: pd.DataFrame):
+        if df.empty: return
+        uso = df.memory_usage(deep=True, index=True)
+        total = uso.sum()
+        print(f"\n--- Uso de memória do DataFrame ({'compacto' if self.modo_compacto else 'padrão'}) ---")
+        print(f"    {len(df)} linhas | {total / 1024**2:.2f} MB | {total / len(df):.1f} bytes/linha")
+        for col, bytes_col in uso.drop('Index').items():
+            print(f"    {col:<22} {str(df[col].dtype):<32} {bytes_col / len(df):6.1f} bytes/linha")
+
+    def _agregar_diario(self, df: pd.DataFrame) -> pd.DataFrame:
+        if df.empty: return pd.DataFrame()
+        # Horário de parede (vale tanto para o modo padrão quanto para o compacto)
+        horario = df['datetime'].dt.tz_localize(None)
+        chave = horario.dt.normalize().rename('data')
+        agregado = df.groupby(chave)[list(AGREGACAO_CAMADAS)].agg(AGREGACAO_CAMADAS)
+        agregado['horas'] = df.groupby(chave).size()
+
+        # Classe de pulverização de cada hora do dia ('0'..'3', '-' = hora ausente), para a matriz hora x mês
+        classes = self._classificar_pulverizacao(df['vento_medio_kph'], df['delta_t'])
+        codigos, dias_unicos = pd.factorize(chave)
+        grade = np.full((len(dias_unicos), 24), ord('-'), dtype=np.uint8)
+        grade[codigos, horario.dt.hour.to_numpy()] = ord('0') + classes
+        agregado['pulverizacao_horas'] = pd.Series([linha.tobytes().decode('ascii') for linha in grade], index=dias_unicos)
+
+        # Formata só os dias únicos, não cada linha horária
+        agregado.index = agregado.index.strftime('%Y-%m-%d').rename('data')
+        return agregado.round(2).reset_index()
+
+    def _contar_horas_pulverizacao(self, textos: pd.Series) -> np.ndarray:
+        # Converte as strings 'pulverizacao_horas' em uma grade (n_dias, 24) de classes; -1 = hora ausente
+        validos = textos[textos.str.len() == 24] if not textos.empty else textos
+        if validos.empty: return np.empty((0, 24), dtype=np.int16)
+        grade = np.frombuffer(''.join(validos).encode('ascii'), dtype=np.uint8).reshape(-1, 24).astype(np.int16) - ord('0')
+        grade[(grade < 0) | (grade >= len(CONDICOES_PULVERIZACAO))] = -1
+        return grade
+
+    def _agregar_mensal(self, diario: pd.DataFrame) -> pd.DataFrame:
+        # Mensal a partir dos dias: soma/mín/máx diretos, médias ponderadas pelas horas de cada dia
+        if diario.empty: return pd.DataFrame()
+        mes = diario['data'].str[:7].rename('data')
+        colunas = {}
+        for col, agg in AGREGACAO_CAMADAS.items():
+            if agg == 'mean':
+                peso = diario['horas'].where(diario[col].notna(), 0)
+                colunas[col] = (diario[col].fillna(0) * peso).groupby(mes).sum() / peso.groupby(mes).sum()
+            else:
+                colunas[col] = diario[col].groupby(mes).agg(agg)
+        mensal = pd.DataFrame(colunas)
+        mensal['horas'] = diario['horas'].groupby(mes).sum()
+
+        # Contagem hora x condição do mês (4 x 24), congelada junto com a camada
+        if 'pulverizacao_horas' in diario.columns:
+            def contar(textos):
+                grade = self._contar_horas_pulverizacao(textos)
+                return json.dumps([(grade == c).sum(axis=0).tolist() for c in range(len(CONDICOES_PULVERIZACAO))])
+            mensal['pulverizacao_hora_mes'] = diario['pulverizacao_horas'].groupby(mes).agg(contar)
+        return mensal.round(2).reset_index()
+
+    def _caminho_camada(self, camada: str, station_id: str) -> str:
+        return os.path.join(DIRETORIO_ARMAZENAMENTO, f"{camada}_{station_id}.csv.gz")
+
+    def _carregar_cobertura(self) -> dict:
+        caminho = os.path.join(DIRETORIO_ARMAZENAMENTO, "cobertura.json")
+        if not os.path.exists(caminho): return {}
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _salvar_cobertura(self, cobertura: dict):
+        with open(os.path.join(DIRETORIO_ARMAZENAMENTO, "cobertura.json"), 'w', encoding='utf-8') as f:
+            json.dump(cobertura, f, indent=2)
+
+    def _diario_congelado(self, station_id: str, inicio: datetime, fim: datetime, cobertura: dict) -> pd.DataFrame | None:
+        # Dias congelados da estação em [inicio, fim], ou None se a camada diária não cobre o período inteiro
+        cob = cobertura.get(station_id, {}).get('diario')
+        caminho = self._caminho_camada('diario', station_id)
+        if cob is None or not os.path.exists(caminho): return None
+        if inicio < datetime.strptime(cob[0], '%Y-%m-%d') or fim > datetime.strptime(cob[1], '%Y-%m-%d'): return None
+        diario = pd.read_csv(caminho, dtype={'data': str, 'pulverizacao_horas': str})
+        return diario[(diario['data'] >= inicio.strftime('%Y-%m-%d')) & (diario['data'] <= fim.strftime('%Y-%m-%d'))]
+
+    def obter_camada_congelada(self, station: dict, camada: str, inicio: datetime, fim: datetime, cobertura: dict) -> pd.DataFrame:
+        """
+        Retorna os agregados ('diario' ou 'mensal') da estação em [inicio, fim].
+        Só busca na API os períodos ainda não cobertos pelo armazenamento local;
+        o que já foi calculado nunca é recalculado. Um período com algum bloco
+        que falhou não é congelado (é usado só nesta execução e buscado de novo na próxima).
+        """
+        station_id = station['id_estacao']
+        station_name = station.get('name', f"ID {station_id}")
+        caminho = self._caminho_camada(camada, station_id)
+        formato = '%Y-%m-%d' if camada == 'diario' else '%Y-%m'
+
+        armazenado = pd.read_csv(caminho, dtype={'data': str, 'pulverizacao_horas': str, 'pulverizacao_hora_mes': str}) if os.path.exists(caminho) else pd.DataFrame(columns=['data'])
+        cob = cobertura.get(station_id, {}).get(camada)
+
+        faltantes = []
+        if cob is None:
+            faltantes.append((inicio, fim))
+            cob_ini, cob_fim = None, None
+        else:
+            cob_ini, cob_fim = datetime.strptime(cob[0], '%Y-%m-%d'), datetime.strptime(cob[1], '%Y-%m-%d')
+            if inicio < cob_ini: faltantes.append((inicio, cob_ini - timedelta(days=1)))
+            if fim > cob_fim: faltantes.append((cob_fim + timedelta(days=1), fim))
+
+        congelados, provisorios = [], []
+        for ini, fi in faltantes:
+            # Meses que saíram da camada diária são montados a partir dos dias já congelados, sem nova busca
+            diario_congelado = self._diario_congelado(station_id, ini, fi, cobertura) if camada == 'mensal' else None
+            if diario_congelado is not None:
+                print(f" -> Camada 'mensal' da estação {station_id}: {ini:%Y-%m-%d} a {fi:%Y-%m-%d} a partir da camada diária")
+                agregado = self._agregar_mensal(diario_congelado)
+                if not agregado.empty: congelados.append(agregado)
+                cob_ini = ini if cob_ini is None else min(cob_ini, ini)
+                cob_fim = fi if cob_fim is None else max(cob_fim, fi)
+                continue
+
+            print(f" -> Camada '{camada}' da estação {station_id}: calculando {ini:%Y-%m-%d} a {fi:%Y-%m-%d}")
+            # Margem de 1 dia: o ajuste de fuso desloca as primeiras/últimas horas para o dia vizinho
+            processados, falhas = self.buscar_e_processar_em_pipeline([station], (ini - timedelta(days=1)).strftime('%Y-%m-%d'), (fi + timedelta(days=1)).strftime('%Y-%m-%d'))
+            agregado = self._agregar_diario(processados.get(station_id, pd.DataFrame()))
+            if not agregado.empty:
+                agregado = agregado[(agregado['data'] >= ini.strftime('%Y-%m-%d')) & (agregado['data'] <= fi.strftime('%Y-%m-%d'))]
+                if camada == 'mensal': agregado = self._agregar_mensal(agregado)
+
+            if falhas.get(station_id):
+                print(f"AVISO: camada '{camada}' da estação {station_id} não congelada para {ini:%Y-%m-%d} a {fi:%Y-%m-%d} (blocos com falha).")
+                if not agregado.empty: provisorios.append(agregado)
+                continue
+            if not agregado.empty: congelados.append(agregado)
+            # Cobertura continua sendo um único intervalo: cada período faltante é vizinho dela
+            cob_ini = ini if cob_ini is None else min(cob_ini, ini)
+            cob_fim = fi if cob_fim is None else max(cob_fim, fi)
+
+        if cob_ini is not None and [cob_ini.strftime('%Y-%m-%d'), cob_fim.strftime('%Y-%m-%d')] != cob:
+            armazenado = pd.concat([armazenado] + congelados, ignore_index=True) if congelados else armazenado
+            armazenado = armazenado.drop_duplicates('data', keep='first').sort_values('data')
+            armazenado.to_csv(caminho, index=False, compression='gzip')
+            cobertura.setdefault(station_id, {})[camada] = [cob_ini.strftime('%Y-%m-%d'), cob_fim.strftime('%Y-%m-%d')]
+            self._salvar_cobertura(cobertura)
+
+        disponivel = pd.concat([armazenado] + provisorios, ignore_index=True).drop_duplicates('data', keep='first') if provisorios else armazenado
+        recorte = disponivel[(disponivel['data'] >= inicio.strftime(formato)) & (disponivel['data'] <= fim.strftime(formato))].sort_values('data').copy()
+        recorte['nome_estacao'] = station_name
+        return recorte
+
+    def gerar_historico_em_camadas(self, inicio_horario: datetime, end_date_dt: datetime) -> dict:
+        """
+        Camadas congeladas anteriores a 'inicio_horario': {'diario': DataFrame, 'mensal': DataFrame}.
+        A camada diária termina no dia (horário de parede) anterior ao primeiro dia horário.
+        """
+        inicio_diario = (end_date_dt - pd.DateOffset(years=ANOS_RESOLUCAO_DIARIA)).to_pydatetime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        inicio_mensal = (end_date_dt - pd.DateOffset(years=ANOS_DE_HISTORICO)).to_pydatetime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        fim_diario = inicio_horario.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        # A camada diária nunca começa antes do início do histórico total
+        inicio_diario = max(inicio_diario, inicio_mensal)
+        fim_mensal = inicio_diario - timedelta(days=1)
+
+        print(f"\nRetenção em camadas: mensal {inicio_mensal:%Y-%m} a {fim_mensal:%Y-%m}, diária {inicio_diario:%Y-%m-%d} a {fim_diario:%Y-%m-%d}, horária a partir de {inicio_horario:%Y-%m-%d}")
+        os.makedirs(DIRETORIO_ARMAZENAMENTO, exist_ok=True)
+        cobertura = self._carregar_cobertura()
+
+        historico = {'diario': pd.DataFrame(), 'mensal': pd.DataFrame()}
+        for camada, ini, fi in (('diario', inicio_diario, fim_diario), ('mensal', inicio_mensal, fim_mensal)):
+            if fi < ini: continue
+            partes = [self.obter_camada_congelada(station, camada, ini, fi, cobertura) for station in self.stations_info]
+            partes = [p for p in partes if not p.empty]
+            if partes:
+                historico[camada] = pd.concat(partes, ignore_index=True)
+        print(f"Camadas congeladas: {len(historico['diario'])} registros diários, {len(historico['mensal'])} registros mensais.")
+        return historico
+
+    def _classificar_pulverizacao(self, vento: np.ndarray, delta_t: np.ndarray) -> np.ndarray:
+        # Mesma regra do getSprayingCondition do dashboard, vetorizada (índices de CONDICOES_PULVERIZACAO)
+        lim = LIMITES_PULVERIZACAO
+        vento = np.asarray(vento, dtype=np.float64)
+        delta_t = np.asarray(delta_t, dtype=np.float64)
+        sem_dados = np.isnan(vento) | np.isnan(delta_t)
+        evitar = (vento > lim['vento_max']) | (delta_t > lim['delta_t_max'])
+        ideal = ((vento >= lim['vento_min']) & (vento <= lim['vento_max_ideal'])
+                 & (delta_t >= lim['delta_t_min']) & (delta_t <= lim['delta_t_max']))
+        return np.select([sem_dados, evitar, ideal], [3, 2, 0], default=1).astype(np.int8)
+
+    def _tabela_diaria_pulverizacao(self, estacoes: pd.Series, dias: pd.Series, classes: np.ndarray) -> pd.DataFrame:
+        # (estacao, data) x condição; 'dias' é datetime normalizado (meia-noite)
+        return (pd.DataFrame({'estacao': estacoes.astype(str).values, 'data': dias.values, 'classe': classes})
+                .groupby(['estacao', 'data', 'classe']).size()
+                .unstack('classe', fill_value=0)
+                .reindex(columns=range(len(CONDICOES_PULVERIZACAO)), fill_value=0))
+
+    def _contagem_diaria_pulverizacao(self, tabela: pd.DataFrame) -> dict:
+        # Só os dias únicos são formatados como texto
+        nomes = sorted(tabela.index.get_level_values('estacao').unique())
+        idx_nome = {n: i for i, n in enumerate(nomes)}
+        dias_unicos = tabela.index.get_level_values('data').unique()
+        texto_dia = dict(zip(dias_unicos, dias_unicos.strftime('%Y-%m-%d')))
+        linhas = [[idx_nome[est], texto_dia[data]] + [int(v) for v in contagens]
+                  for (est, data), contagens in zip(tabela.index, tabela.to_numpy())]
+        return {'estacoes': nomes, 'colunas': ['estacao', 'data'] + CONDICOES_PULVERIZACAO, 'linhas': linhas}
+
+    def calcular_estatisticas_pulverizacao(self, df: pd.DataFrame, all_forecasts: dict, historico_camadas: dict | None = None) -> dict:
+        print("\nCalculando estatísticas históricas da janela de pulverização...")
+        resultado = {'limites': LIMITES_PULVERIZACAO, 'condicoes': CONDICOES_PULVERIZACAO,
+                     'diario': None, 'diario_previsao': None, 'hora_mes': {}}
+        # Na retenção em camadas, as classes por hora das camadas congeladas completam os dados horários
+        diario_camada = (historico_camadas or {}).get('diario', pd.DataFrame())
+        mensal_camada = (historico_camadas or {}).get('mensal', pd.DataFrame())
+        if 'pulverizacao_horas' not in diario_camada.columns: diario_camada = pd.DataFrame()
+        if 'pulverizacao_hora_mes' not in mensal_camada.columns: mensal_camada = pd.DataFrame()
+
+        nomes = set()
+        if not df.empty: nomes.update(df['nome_estacao'].astype(str).unique())
+        if not diario_camada.empty: nomes.update(diario_camada['nome_estacao'])
+        if not mensal_camada.empty: nomes.update(mensal_camada['nome_estacao'])
+        nomes = sorted(nomes)
+
+        if nomes:
+            # Matriz hora do dia x mês: contagem por condição, estação 0 = 'todas'
+            idx_nome = {n: i + 1 for i, n in enumerate(nomes)}
+            contagens = np.zeros((len(nomes) + 1, 24, 12, len(CONDICOES_PULVERIZACAO)), dtype=np.int64)
+            tabelas = []
+
+            if not df.empty:
+                classes = self._classificar_pulverizacao(df['vento_medio_kph'], df['delta_t'])
+                dias = df['datetime'].dt.tz_localize(None).dt.normalize()
+                tabelas.append(self._tabela_diaria_pulverizacao(df['nome_estacao'], dias, classes))
+                idx_estacao = pd.Categorical(df['nome_estacao'].astype(str), categories=nomes).codes + 1
+                horas = df['datetime'].dt.hour.to_numpy()
+                meses = df['datetime'].dt.month.to_numpy() - 1
+                np.add.at(contagens, (idx_estacao, horas, meses, classes), 1)
+
+            if not diario_camada.empty:
+                diario_camada = diario_camada[diario_camada['pulverizacao_horas'].str.len() == 24]
+                grade = self._contar_horas_pulverizacao(diario_camada['pulverizacao_horas'])
+                linha, hora = np.nonzero(grade >= 0)
+                idx_estacao = diario_camada['nome_estacao'].map(idx_nome).to_numpy()
+                meses = diario_camada['data'].str[5:7].astype(int).to_numpy() - 1
+                np.add.at(contagens, (idx_estacao[linha], hora, meses[linha], grade[linha, hora]), 1)
+                indice = pd.MultiIndex.from_arrays([diario_camada['nome_estacao'].to_numpy(), pd.to_datetime(diario_camada['data']).to_numpy()], names=['estacao', 'data'])
+                tabelas.append(pd.DataFrame({c: (grade == c).sum(axis=1) for c in range(len(CONDICOES_PULVERIZACAO))}, index=indice))
+
+            for nome, data, texto in zip(mensal_camada.get('nome_estacao', []), mensal_camada.get('data', []), mensal_camada.get('pulverizacao_hora_mes', [])):
+                if isinstance(texto, str):
+                    contagens[idx_nome[nome], :, int(data[5:7]) - 1, :] += np.array(json.loads(texto)).T
+
+            contagens[0] = contagens[1:].sum(axis=0)
+            if tabelas:
+                tabela = pd.concat(tabelas).groupby(level=['estacao', 'data']).sum() if len(tabelas) > 1 else tabelas[0]
+                resultado['diario'] = self._contagem_diaria_pulverizacao(tabela)
+
+            horas_validas = contagens[..., :3].sum(axis=-1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                perc_ideal = np.round(100 * contagens[..., 0] / horas_validas, 1)
+            for i, nome in enumerate(['todas'] + nomes):
+                resultado['hora_mes'][nome] = {
+                    'ideal_perc': [[None if np.isnan(v) else float(v) for v in linha] for linha in perc_ideal[i]],
+                    'horas': horas_validas[i].tolist(),
+                }
+
+        # Previsão horária de todas as estações em uma única passada
+        linhas_previsao = [{'estacao': nome, **hora} for nome, horas in all_forecasts.get('hourly', {}).items() for hora in (horas or [])]
+        if linhas_previsao:
+            df_prev = pd.DataFrame(linhas_previsao).dropna(subset=['fcst_valid_local'])
+            classes_prev = self._classificar_pulverizacao(pd.to_numeric(df_prev['wspd'], errors='coerce'),
+                                                          pd.to_numeric(df_prev['delta_t'], errors='coerce'))
+            resultado['diario_previsao'] = self._contagem_diaria_pulverizacao(self._tabela_diaria_pulverizacao(df_prev['estacao'], pd.to_datetime(df_prev['fcst_valid_local'].str[:10]), classes_prev))
+
+        return resultado
+
+    def gerar_html_final(self, df: pd.DataFrame, geodata: dict, all_forecasts: dict, spray_stats: dict, historico_camadas: dict | None = None, agg_server_url: str | None = None) -> str:
         print("\nGerando relatório HTML...")
-        json_data = df.to_json(orient='records', date_format='iso')
+        df_json = df
+        if not df.empty and str(df['datetime'].dt.tz) != 'UTC':
+            # O dashboard lê o horário local via getUTC*: serializa o horário de parede como UTC
+            df_json = df.assign(datetime=df['datetime'].dt.tz_localize(None).dt.tz_localize('UTC'))
+        # float32 exige menos casas decimais para não serializar ruído de precisão (23.2999992371)
+        precisao = 6 if not df.select_dtypes('float32').empty else 10
+        # No modo servidor o dashboard consulta o servidor local: as linhas horárias não vão para o HTML
+        json_data = df_json.to_json(orient='records', date_format='iso', double_precision=precisao) if agg_server_url is None else '[]'
         json_geodata = json.dumps(geodata)
         json_all_forecasts = json.dumps(all_forecasts)
+        json_spray_stats = json.dumps(spray_stats)
+        # As classes de pulverização por hora das camadas já entram em spray_stats; o dashboard não precisa delas
+        json_historico_camadas = json.dumps({camada: json.loads(dados.drop(columns=['pulverizacao_horas', 'pulverizacao_hora_mes'], errors='ignore').to_json(orient='records'))
+                                             for camada, dados in (historico_camadas or {'diario': pd.DataFrame(), 'mensal': pd.DataFrame()}).items()})
+        # None -> o dashboard agrega no navegador; "" -> consulta o servidor local (mesma origem)
+        json_agg_server_url = json.dumps(agg_server_url)
 
         html_template = """
 <!DOCTYPE html>
@@ -281,6 +838,7 @@ class RelatorioClimaCompleto:
         .spray-hour-tooltip { position: relative; } .spray-hour-tooltip .tooltip-text { visibility: hidden; width: 150px; background-color: #0a192f; color: #fff; text-align: center; border-radius: 6px; padding: 5px 0; position: absolute; z-index: 10; bottom: 115%; left: 50%; margin-left: -75px; opacity: 0; transition: opacity 0.3s; border: 1px solid #64ffda;} .spray-hour-tooltip:hover .tooltip-text { visibility: visible; opacity: 1; }
         .spraying-window-axis { display: flex; width: 100%; margin-top: 5px; } .axis-label { flex: 1; text-align: center; font-size: 0.75em; color: #8892b0; } .spray-legend { display: flex; justify-content: center; gap: 20px; margin-top: 15px; font-size: 0.9em; } .legend-item { display: flex; align-items: center; gap: 8px; } .legend-color-box { width: 15px; height: 15px; border-radius: 3px; }
         #spraying-summary { font-size: 0.9em; text-align: center; color: #a8b2d1; margin-top: 15px; background-color: #0a192f; padding: 10px; border-radius: 5px; border: 1px solid #1a3d6e;} #spraying-window-card { grid-column: 1 / -1; }
+        #spray-climatology-card { grid-column: 1 / -1; } #forecast-spray-summary { font-size: 0.9em; text-align: center; color: #a8b2d1; margin-top: 15px; background-color: #0a192f; padding: 10px; border-radius: 5px; border: 1px solid #1a3d6e; } .spray-climatology-table { width: 100%; border-collapse: collapse; font-size: 0.75em; table-layout: fixed; } .spray-climatology-table th { color: #8892b0; font-weight: normal; padding: 3px; } .spray-climatology-table td { text-align: center; padding: 3px 0; color: #0a192f; border: 1px solid #0a192f; } #spray-climatology-summary { font-size: 0.85em; color: #a8b2d1; margin-top: 15px; text-align: center; }
         #forecast-table-container { background-color: #112240; padding: 20px; border-radius: 8px; border: 1px solid #1a3d6e; margin-top:20px; } .forecast-table { width: 100%; border-collapse: collapse; color: #ccd6f6; } .forecast-table th, .forecast-table td { padding: 12px 15px; text-align: left; border-bottom: 1px solid #1a3d6e; } .forecast-table th { color: #8892b0; text-transform: uppercase; font-size: 0.85em; } .forecast-table tr:last-child td { border-bottom: none; } .forecast-table tr:hover { background-color: #1a3d6e; } .forecast-date { font-weight: bold; color: #64ffda; } .forecast-temp-max { color: #ffb3b3; } .forecast-temp-min { color: #a6d8f8; } .forecast-precip-prob { font-weight: bold; color: #82d8c3; }
         #hourly-forecast-wrapper { background-color: #112240; padding: 20px; border-radius: 8px; border: 1px solid #1a3d6e; margin-bottom: 20px; }
         .forecast-header { background-color: #112240; padding: 15px; border-radius: 8px; display: flex; gap: 20px; align-items: center; flex-wrap: wrap; border: 1px solid #1a3d6e; margin-bottom: 20px;} .forecast-header label { font-weight: bold; margin-right: 5px; color: #8892b0; } .forecast-header select { background-color: #0a192f; border: 1px solid #1a3d6e; color: #e6f1ff; padding: 8px; border-radius: 5px; }
@@ -312,7 +870,7 @@ class RelatorioClimaCompleto:
             <button class="tab-button" onclick="openTab(event, 'tabMapa')">🗺️ Mapa Interativo</button>
             <button class="tab-button" onclick="openTab(event, 'tabPrevisao')">🔮 Previsão 10 Dias</button>
         </div>
-        <div id="tabChuva" class="tab-content active"><div class="kpi-grid"><div class="kpi-card"><h4>Chuva Acumulada Média</h4><div class="value" id="kpi-chuva">0,0</div><span style="color:#8892b0;">mm</span></div><div class="kpi-card"><h4>Média Diária</h4><div class="value" id="kpi-chuva-media">0,0</div><span style="color:#8892b0;">mm/dia</span></div><div class="kpi-card"><h4>Máx. Chuva 24h</h4><div class="value" id="kpi-max-chuva-24h">0,0</div><span style="color:#8892b0;">mm</span></div><div class="kpi-card"><h4>Dias com Chuva</h4><div class="value" id="kpi-dias-chuva">0</div><span style="color:#8892b0;">(> 1mm)</span></div></div><div class="charts-grid"><div class="chart-card"><h3>Precipitação Diária (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaDiaria"></canvas></div></div><div class="chart-card"><h3>Precipitação Mensal (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaMensal"></canvas></div></div><div class="chart-card"><h3>Precipitação por Estação (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaEstacao"></canvas></div></div></div></div>
+        <div id="tabChuva" class="tab-content active"><div class="kpi-grid"><div class="kpi-card"><h4>Chuva Acumulada Média</h4><div class="value" id="kpi-chuva">0,0</div><span style="color:#8892b0;">mm</span></div><div class="kpi-card"><h4>Média Diária</h4><div class="value" id="kpi-chuva-media">0,0</div><span style="color:#8892b0;">mm/dia</span></div><div class="kpi-card"><h4>Máx. Chuva 24h</h4><div class="value" id="kpi-max-chuva-24h">0,0</div><span style="color:#8892b0;">mm</span></div><div class="kpi-card"><h4>Dias com Chuva</h4><div class="value" id="kpi-dias-chuva">0</div><span style="color:#8892b0;">(> 1mm)</span></div></div><div class="charts-grid"><div class="chart-card"><h3>Precipitação Diária (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaDiaria"></canvas></div></div><div class="chart-card"><h3>Precipitação Mensal (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaMensal"></canvas></div></div><div class="chart-card"><h3>Precipitação por Estação (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaEstacao"></canvas></div></div><div class="chart-card"><h3>Comparativo Anual de Chuva Mensal (mm, todo o histórico)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaComparativoAnual"></canvas></div></div></div></div>
         <div id="tabTemperatura" class="tab-content"><div class="kpi-grid"><div class="kpi-card"><h4>Temp. Máxima</h4><div class="value" id="kpi-temp-max">0,0</div><span style="color:#8892b0;">°C</span></div><div class="kpi-card"><h4>Temp. Média</h4><div class="value" id="kpi-temp-media">0,0</div><span style="color:#8892b0;">°C</span></div><div class="kpi-card"><h4>Temp. Mínima</h4><div class="value" id="kpi-temp-min">0,0</div><span style="color:#8892b0;">°C</span></div></div><div class="charts-grid"><div class="chart-card"><h3>Temperaturas Diárias (°C)</h3><div class="chart-canvas-wrapper"><canvas id="chartTemperatura"></canvas></div></div></div></div>
         <div id="tabUmidade" class="tab-content"><div class="kpi-grid"><div class="kpi-card"><h4>Umidade Máxima</h4><div class="value" id="kpi-umidade-max">0,0</div><span style="color:#8892b0;">%</span></div><div class="kpi-card"><h4>Umidade Média</h4><div class="value" id="kpi-umidade-media">0,0</div><span style="color:#8892b0;">%</span></div><div class="kpi-card"><h4>Umidade Mínima</h4><div class="value" id="kpi-umidade-min">0,0</div><span style="color:#8892b0;">%</span></div></div><div class="charts-grid"><div class="chart-card"><h3>Umidade Relativa Diária (%)</h3><div class="chart-canvas-wrapper"><canvas id="chartUmidade"></canvas></div></div></div></div>
         <div id="tabVento" class="tab-content"><div class="kpi-grid"><div class="kpi-card"><h4>Vento Médio</h4><div class="value" id="kpi-vento-medio">0,0</div><span style="color:#8892b0;">km/h</span></div><div class="kpi-card"><h4>Rajada Máxima</h4><div class="value" id="kpi-rajada-max">0,0</div><span style="color:#8892b0;">km/h</span></div></div><div class="charts-grid"><div class="chart-card"><h3>Média de Vento Mensal (km/h)</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoMensal"></canvas></div></div><div class="chart-card"><h3>Vento Médio e Rajada Máxima Diária (km/h)</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoDiario"></canvas></div></div><div class="chart-card"><h3>Frequência da Direção do Vento</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoDirecao"></canvas></div></div><div class="chart-card"><h3>Média de Vento por Hora do Dia (km/h)</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoHorario"></canvas></div></div><div class="chart-card"><h3>Rosa dos Ventos</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoRosa"></canvas></div></div></div></div>
@@ -330,7 +888,7 @@ class RelatorioClimaCompleto:
             </div>
         </div>
 
-        <div id="tabDeltaT" class="tab-content"><div class="charts-grid" style="grid-template-columns: repeat(auto-fit, minmax(450px, 1fr));"><div class="chart-card"><h3>Análise Mensal da Janela de Pulverização (% de Horas)</h3><div class="chart-canvas-wrapper"><canvas id="chartSprayConditionsByMonth"></canvas></div></div><div class="chart-card"><h3>Condições Médias por Hora (Vento e Delta T)</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoDeltaTHorario"></canvas></div></div><div class="chart-card"><h3>Média de GFDI por Hora</h3><div class="chart-canvas-wrapper"><canvas id="chartGFDIHorario"></canvas></div></div></div></div>
+        <div id="tabDeltaT" class="tab-content"><div class="charts-grid" style="grid-template-columns: repeat(auto-fit, minmax(450px, 1fr));"><div class="chart-card"><h3>Análise Mensal da Janela de Pulverização (% de Horas)</h3><div class="chart-canvas-wrapper"><canvas id="chartSprayConditionsByMonth"></canvas></div></div><div class="chart-card"><h3>Condições Médias por Hora (Vento e Delta T)</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoDeltaTHorario"></canvas></div></div><div class="chart-card"><h3>Média de GFDI por Hora</h3><div class="chart-canvas-wrapper"><canvas id="chartGFDIHorario"></canvas></div></div><div class="chart-card" id="spray-climatology-card"><h3>Climatologia de Pulverização (% de Horas Ideais por Hora x Mês)</h3><div id="spray-climatology-container"></div><div id="spray-climatology-summary"></div></div></div></div>
         <div id="tabMonitoramento" class="tab-content"><div class="calendar-container"><div class="calendar-header"><button id="prev-month-btn">&lt; Mês Anterior</button><h2 id="month-year-header"></h2><button id="next-month-btn">Próximo Mês &gt;</button></div><div class="calendar-weekdays"><div>Dom</div><div>Seg</div><div>Ter</div><div>Qua</div><div>Qui</div><div>Sex</div><div>Sáb</div></div><div id="calendar-grid" class="calendar-grid"></div></div><div id="daily-details-container" style="display: none;"><h2 id="selected-day-header" style="text-align: center;"></h2><div class="charts-grid" style="grid-template-columns: repeat(auto-fit, minmax(400px, 1fr));"><div class="chart-card"><h3>Condições de Vento e Delta T</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoDeltaTDiario"></canvas></div></div><div class="chart-card"><h3>Condições Térmicas e de Umidade</h3><div class="chart-canvas-wrapper"><canvas id="chartTempUmidadeDiario"></canvas></div></div><div class="chart-card"><h3>Precipitação Horária (mm)</h3><div class="chart-canvas-wrapper"><canvas id="chartChuvaHoraria"></canvas></div></div><div class="chart-card"><h3>Rosa dos Ventos do Dia</h3><div class="chart-canvas-wrapper"><canvas id="chartVentoRosaDiario"></canvas></div></div><div class="chart-card" id="spraying-window-card"><h3>Janela de Pulverização do Dia</h3><div id="spraying-window-container"></div><div class="spray-legend"><div class="legend-item"><div class="legend-color-box" style="background-color:#28a745;"></div>Ideal</div><div class="legend-item"><div class="legend-color-box" style="background-color:#ffc107;"></div>Atenção</div><div class="legend-item"><div class="legend-color-box" style="background-color:#dc3545;"></div>Evitar</div><div class="legend-item"><div class="legend-color-box" style="background-color:#6c757d;"></div>S/ Dados</div></div><p id="spraying-summary"></p></div></div></div></div>
         <div id="tabAvisos" class="tab-content">
                     <div id="future-alerts-container"></div>
@@ -345,6 +903,7 @@ class RelatorioClimaCompleto:
             <div id="hourly-forecast-wrapper">
                 <h3>Previsão Horária (Próximas 48h)</h3>
                 <div id="hourly-forecast-container"></div>
+                <div id="forecast-spray-summary"></div>
                 <div class="spray-legend">
                     <div class="legend-item"><div class="legend-color-box" style="background-color:#28a745;"></div>Ideal</div>
                     <div class="legend-item"><div class="legend-color-box" style="background-color:#ffc107;"></div>Atenção</div>
@@ -364,19 +923,49 @@ class RelatorioClimaCompleto:
     <script id="dados-climaticos" type="application/json">__JSON_DATA__</script>
     <script id="dados-geograficos" type="application/json">__GEODATA__</script>
     <script id="dados-todas-previsoes" type="application/json">__JSON_ALL_FORECASTS__</script>
+    <script id="dados-pulverizacao" type="application/json">__JSON_SPRAY_STATS__</script>
+    <script id="dados-historico-camadas" type="application/json">__JSON_HISTORICO_CAMADAS__</script>
     <script>
-        const MESES_PT_BR = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]; const CARDINAL_DIRECTIONS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']; const SPRAY_COLORS = { Ideal: '#28a745', Atenção: '#ffc107', Evitar: '#dc3545', NoData: '#6c757d' }; let map, geoData, allData, allForecastData, charts = {}; let fieldLayers = {}, stationMarkers = {}, mapLegend; let calendarDate = new Date(); let currentFilteredData = []; let currentDailyAggregated = []; let selectedCalendarDay = null; let stationColors = {};
+        const MESES_PT_BR = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]; const CARDINAL_DIRECTIONS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']; const SPRAY_COLORS = { Ideal: '#28a745', Atenção: '#ffc107', Evitar: '#dc3545', NoData: '#6c757d' }; let map, geoData, allData, allForecastData, historicoCamadas, charts = {}; let fieldLayers = {}, stationMarkers = {}, mapLegend; let calendarDate = new Date(); let currentFilteredData = []; let currentDailyAggregated = []; let selectedCalendarDay = null; let stationColors = {};
+        const AGG_SERVER_URL = __AGG_SERVER_URL__;
+        // Uma consulta em andamento por canal: a nova cancela a anterior, então uma resposta atrasada nunca sobrescreve a mais recente
+        const controladoresServidor = {};
+        const INICIO_RADIACAO = '2025-11-05'; // Filtro rígido dos gráficos de radiação
         const mapMetricsConfig = { chuva: { key: 'precipitacao_mm', agg: 'sum', label: 'Chuva Acumulada', unit: 'mm', colors: ['#f7fbff', '#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#08519c', '#08306b'] }, temp_media: { key: 'temp_media_c', agg: 'avg', label: 'Temperatura Média', unit: '°C', colors: ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a', '#ef3b2c', '#cb181d', '#a50f15', '#67000d'] }, umidade_media: { key: 'umidade_media_perc', agg: 'avg', label: 'Umidade Média', unit: '%', colors: ['#f7fcf5', '#e5f5e0', '#c7e9c0', '#a1d99b', '#74c476', '#41ab5d', '#238b45', '#006d2c', '#00441b'] }, vento_medio: { key: 'vento_medio_kph', agg: 'avg', label: 'Vento Médio', unit: 'km/h', colors: ['#fcfbfd', '#efedf5', '#dadaeb', '#bcbddc', '#9e9ac8', '#807dba', '#6a51a3', '#54278f', '#3f007d'] }, rajada_max: { key: 'rajada_max_kph', agg: 'max', label: 'Rajada Máxima', unit: 'km/h', colors: ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'] } };
         const ALERT_THRESHOLDS = { RAIN_LIMIT: 50, GUST_LIMIT: 50, TEMP_HIGH: 40, TEMP_LOW: 5, HUM_LOW: 20, DELTA_T_HIGH: 9 };
         function openTab(evt, tabName) { document.querySelectorAll('.tab-content').forEach(tc => tc.classList.remove('active')); document.querySelectorAll('.tab-button').forEach(tb => tb.classList.remove('active')); document.getElementById(tabName).classList.add('active'); evt.currentTarget.classList.add('active'); if (tabName === 'tabMapa' && map) { setTimeout(() => map.invalidateSize(), 10); } }
         function degreesToCardinal(deg) { if (deg === null || isNaN(deg)) return null; return CARDINAL_DIRECTIONS[Math.round(deg / 22.5) % 16]; }
         function fNum(value, decimals = 1) { if (typeof value !== 'number' || isNaN(value)) return 'N/D'; return value.toLocaleString('pt-BR', { minimumFractionDigits: decimals, maximumFractionDigits: decimals }); }
-        function getSprayingCondition(wind, deltaT) { if (wind === null || isNaN(wind) || deltaT === null || isNaN(deltaT)) return 'NoData'; if (wind > 9 || deltaT > 10) return 'Evitar'; if ((wind >= 2 && wind <= 8) && (deltaT >= 2 && deltaT <= 10)) return 'Ideal'; return 'Atenção'; }
+        const sprayStats = JSON.parse(document.getElementById('dados-pulverizacao').textContent); const SPRAY_LIMITS = sprayStats.limites;
+        function getSprayingCondition(wind, deltaT) { if (wind === null || isNaN(wind) || deltaT === null || isNaN(deltaT)) return 'NoData'; if (wind > SPRAY_LIMITS.vento_max || deltaT > SPRAY_LIMITS.delta_t_max) return 'Evitar'; if ((wind >= SPRAY_LIMITS.vento_min && wind <= SPRAY_LIMITS.vento_max_ideal) && (deltaT >= SPRAY_LIMITS.delta_t_min && deltaT <= SPRAY_LIMITS.delta_t_max)) return 'Ideal'; return 'Atenção'; }
+        function renderSprayClimatology(station) {
+            const container = document.getElementById('spray-climatology-container'); const summary = document.getElementById('spray-climatology-summary');
+            const matrix = sprayStats.hora_mes[station === 'todas' ? 'todas' : station];
+            if (!matrix) { container.innerHTML = '<p style="text-align:center;">Sem dados históricos para a climatologia de pulverização.</p>'; summary.innerText = ''; return; }
+            let html = '<table class="spray-climatology-table"><tr><th></th>' + MESES_PT_BR.map(m => `<th>${m.substring(0,3)}</th>`).join('') + '</tr>';
+            for (let h = 0; h < 24; h++) { html += `<tr><th>${String(h).padStart(2,'0')}h</th>`; for (let m = 0; m < 12; m++) { const v = matrix.ideal_perc[h][m]; const color = v === null ? SPRAY_COLORS.NoData : `hsl(${Math.round(v * 1.2)}, 70%, 55%)`; html += `<td style="background-color:${color}" title="${MESES_PT_BR[m]} ${h}h: ${v === null ? 'N/D' : fNum(v, 0) + '% ideal'} (${matrix.horas[h][m]} h)">${v === null ? '' : fNum(v, 0)}</td>`; } html += '</tr>'; }
+            container.innerHTML = html + '</table>';
+            const daily = sprayStats.diario; if (!daily) { summary.innerText = ''; return; }
+            const stationIdx = daily.estacoes.indexOf(station); const idealByMonth = Array(12).fill(0), daysByMonth = Array(12).fill(0);
+            daily.linhas.forEach(row => { if (station !== 'todas' && row[0] !== stationIdx) return; const m = parseInt(row[1].substring(5, 7)) - 1; idealByMonth[m] += row[2]; daysByMonth[m]++; });
+            summary.innerText = 'Média de horas ideais por dia: ' + MESES_PT_BR.map((m, i) => daysByMonth[i] ? `${m.substring(0,3)} ${fNum(idealByMonth[i] / daysByMonth[i], 1)}h` : null).filter(Boolean).join(' · ');
+        }
         
         function updateForecastDisplay() {
             const selectedStation = document.getElementById('forecast-station-selector').value;
             renderForecastTable(selectedStation);
             renderHourlyForecast(selectedStation);
+            renderForecastSprayCounts(selectedStation);
+        }
+        function renderForecastSprayCounts(station) {
+            // Contagem de horas ideais por dia calculada no Python (sprayStats.diario_previsao); 'average' = média entre estações
+            const container = document.getElementById('forecast-spray-summary'); const daily = sprayStats.diario_previsao;
+            if (!daily || daily.linhas.length === 0) { container.style.display = 'none'; return; }
+            const stationIdx = daily.estacoes.indexOf(station); const byDay = {};
+            daily.linhas.forEach(row => { if (station !== 'average' && row[0] !== stationIdx) return; if (!byDay[row[1]]) byDay[row[1]] = { ideal: 0, total: 0, n: 0 }; byDay[row[1]].ideal += row[2]; byDay[row[1]].total += row[2] + row[3] + row[4] + row[5]; byDay[row[1]].n++; });
+            const days = Object.keys(byDay).sort(); if (days.length === 0) { container.style.display = 'none'; return; }
+            container.style.display = 'block';
+            container.innerText = 'Horas ideais para pulverização na previsão: ' + days.map(day => { const d = byDay[day]; return `${day.substring(8, 10)}/${day.substring(5, 7)}: ${fNum(d.ideal / d.n, d.n > 1 ? 1 : 0)}h de ${fNum(d.total / d.n, 0)}h`; }).join(' · ');
         }
         function getAverageForecast(forecastType) {
             const stationNames = Object.keys(allForecastData[forecastType]);
@@ -457,15 +1046,16 @@ class RelatorioClimaCompleto:
             allData = JSON.parse(document.getElementById('dados-climaticos').textContent).map(d => { d.datetime = new Date(d.datetime); return d; });
             geoData = JSON.parse(document.getElementById('dados-geograficos').textContent);
             allForecastData = JSON.parse(document.getElementById('dados-todas-previsoes').textContent);
+            historicoCamadas = JSON.parse(document.getElementById('dados-historico-camadas').textContent);
 
-            function iniciarDashboard() { 
-                if (allData.length === 0 && (!geoData || !geoData.fields || geoData.fields.length === 0)) { document.querySelector('.container').innerHTML = '<h1>Nenhum dado encontrado para gerar o relatório.</h1>'; return; }; 
-                if (allData.length > 0) { 
+            function iniciarDashboard(uniqueStations, minDate, maxDate) { 
+                if (uniqueStations.length === 0 && (!geoData || !geoData.fields || geoData.fields.length === 0)) { document.querySelector('.container').innerHTML = '<h1>Nenhum dado encontrado para gerar o relatório.</h1>'; return; }; 
+                if (uniqueStations.length > 0) { 
                     const stationFilter = document.getElementById('station-filter'); const forecastStationFilter = document.getElementById('forecast-station-selector'); 
-                    const uniqueStations = [...new Set(allData.map(d => d.nome_estacao))]; 
+                    
                     if(uniqueStations.length > 1) forecastStationFilter.innerHTML = '<option value="average">Média Geral</option>'; 
                     uniqueStations.forEach((name, index) => { const optionHtml = `<option value="${name}">${name}</option>`; stationFilter.innerHTML += optionHtml; forecastStationFilter.innerHTML += optionHtml; stationColors[name] = Chart.getSpacedColors(uniqueStations.length)[index]; }); 
-                    const minDate = new Date(Math.min(...allData.map(d=>d.datetime))); const maxDate = new Date(Math.max(...allData.map(d=>d.datetime))); 
+                    
                     document.getElementById('start-date').valueAsDate = new Date(minDate.getUTCFullYear(), minDate.getUTCMonth(), minDate.getUTCDate()); 
                     document.getElementById('end-date').valueAsDate = new Date(maxDate.getUTCFullYear(), maxDate.getUTCMonth(), maxDate.getUTCDate()); 
                     calendarDate = maxDate; 
@@ -476,6 +1066,7 @@ class RelatorioClimaCompleto:
                 charts.chuvaDiaria = new Chart(document.getElementById('chartChuvaDiaria'), { type: 'bar', options: stackedOptions }); 
                 charts.chuvaMensal = new Chart(document.getElementById('chartChuvaMensal'), { type: 'bar', options: { ...stackedOptions, scales: { ...stackedOptions.scales, x: { ...stackedOptions.scales.x, ticks: { ...stackedOptions.scales.x.ticks, callback: function(value) { const label = this.getLabelForValue(value); const [year, monthNum] = label.split('-'); return MESES_PT_BR[parseInt(monthNum) - 1].substring(0,3) + ' ' + year; } } } } } }); 
                 charts.chuvaEstacao = new Chart(document.getElementById('chartChuvaEstacao'), { type: 'bar', options: { ...commonOptions, plugins: { ...commonOptions.plugins, datalabels: { display: true, anchor: 'end', align: 'top', formatter: v => fNum(v,0), color: 'white' } }, layout: { padding: { top: 30 } } } }); 
+                charts.chuvaComparativoAnual = new Chart(document.getElementById('chartChuvaComparativoAnual'), { type: 'line', options: commonOptions, data: { labels: MESES_PT_BR.map(m => m.substring(0,3)), datasets: [] } }); 
                 charts.temperatura = new Chart(document.getElementById('chartTemperatura'), { type: 'line', options: commonOptions }); 
                 charts.umidade = new Chart(document.getElementById('chartUmidade'), { type: 'line', options: commonOptions }); 
                 charts.ventoMensal = new Chart(document.getElementById('chartVentoMensal'), { type: 'bar', options: {...commonOptions, scales: {...commonOptions.scales, x: {...commonOptions.scales.x, offset: true }}} }); 
@@ -503,10 +1094,25 @@ class RelatorioClimaCompleto:
             }
             
             function atualizarTudo() { 
-                const startDate = new Date(document.getElementById('start-date').value + "T00:00:00Z"); const endDate = new Date(document.getElementById('end-date').value + "T23:59:59Z"); const selectedStation = document.getElementById('station-filter').value; 
-                currentFilteredData = allData.filter(d => { const stationMatch = (selectedStation === 'todas' || d.nome_estacao === selectedStation); const dateMatch = d.datetime >= startDate && d.datetime <= endDate; return stationMatch && dateMatch; }); 
+                const startStr = document.getElementById('start-date').value; const endStr = document.getElementById('end-date').value; const selectedStation = document.getElementById('station-filter').value; 
+                const numStations = (selectedStation === 'todas') ? (Object.keys(stationColors).length || 1) : 1; 
+                const renderizarResumo = resumo => { currentDailyAggregated = resumo.diario; atualizarGraficos(resumo); renderCalendar(calendarDate); generateAndRenderHistoricalAlerts(resumo.diarioPorEstacao); }; 
+                if (AGG_SERVER_URL !== null) { 
+                    const sinal = novoSinal('resumo'); 
+                    resumoServidor(startStr, endStr, selectedStation, numStations, sinal).then(resumo => { if (!sinal.aborted) renderizarResumo(resumo); }).catch(e => { if (e.name !== 'AbortError') console.error(e); }); 
+                } else { 
+                    const startDate = new Date(startStr + "T00:00:00Z"); const endDate = new Date(endStr + "T23:59:59Z"); 
+                    currentFilteredData = allData.filter(d => { const stationMatch = (selectedStation === 'todas' || d.nome_estacao === selectedStation); const dateMatch = d.datetime >= startDate && d.datetime <= endDate; return stationMatch && dateMatch; }); 
+                    renderizarResumo(resumoLocal(currentFilteredData, numStations)); 
+                } 
+                atualizarMapa(); generateAndRenderFutureAlerts(); updateForecastDisplay(); renderSprayClimatology(selectedStation); atualizarComparativoAnual(selectedStation); document.getElementById('daily-details-container').style.display = 'none'; selectedCalendarDay = null; 
+            }
+            function novoSinal(canal) { if (controladoresServidor[canal]) controladoresServidor[canal].abort(); controladoresServidor[canal] = new AbortController(); return controladoresServidor[canal].signal; }
+            function consultarServidor(rota, params, signal) { return fetch(`${AGG_SERVER_URL}/${rota}?${new URLSearchParams(params)}`, { signal }).then(r => { if (!r.ok) throw new Error(`Servidor de agregação: HTTP ${r.status}`); return r.json(); }); }
+            // Resumo do filtro atual (tudo o que os gráficos, o calendário e os alertas usam) calculado a partir das linhas horárias embutidas
+            function resumoLocal(data, numStations) {
                 const dailyData = {}; 
-                currentFilteredData.forEach(d => { 
+                data.forEach(d => { 
                     const day = d.datetime.toISOString().split('T')[0]; 
                     if (!dailyData[day]) { dailyData[day] = {precip_by_station: {}, temp_min_c: [], temp_max_c: [], temp_media_c: [], umidade_min_perc: [], umidade_max_perc: [], umidade_media_perc: [], vento_medio_kph: [], rajada_max_kph: [], radiacao_solar_acc: []}; } 
                     if(d.precipitacao_mm > 0) { dailyData[day].precip_by_station[d.nome_estacao] = (dailyData[day].precip_by_station[d.nome_estacao] || 0) + d.precipitacao_mm; } 
@@ -514,32 +1120,109 @@ class RelatorioClimaCompleto:
                     if(d.radiacao_solar !== null) dailyData[day].radiacao_solar_acc.push(d.radiacao_solar);
                 }); 
                 const avg = (arr) => arr.length ? arr.reduce((a, b) => a + b, 0) / arr.length : NaN; 
-                currentDailyAggregated = Object.keys(dailyData).sort().map(day => { const d = dailyData[day]; const numStations = (document.getElementById('station-filter').value === 'todas') ? (Object.keys(stationColors).length || 1) : 1; const totalPrecip = Object.values(d.precip_by_station).reduce((a,b) => a+b, 0); const totalRad = d.radiacao_solar_acc.reduce((a,b)=>a+b, 0); return { data_str: day, precip_by_station: d.precip_by_station, precipitacao_mm: totalPrecip, precipitacao_media_mm: totalPrecip / numStations, temp_min_c: Math.min(...d.temp_min_c.filter(v => v !== null)), temp_max_c: Math.max(...d.temp_max_c.filter(v => v !== null)), temp_media_c: avg(d.temp_media_c.filter(v => v !== null)), umidade_min_perc: Math.min(...d.umidade_min_perc.filter(v => v !== null)), umidade_max_perc: Math.max(...d.umidade_max_perc.filter(v => v !== null)), umidade_media_perc: avg(d.umidade_media_perc.filter(v => v !== null)), vento_medio_kph: avg(d.vento_medio_kph.filter(v => v !== null)), rajada_max_kph: Math.max(0, ...d.rajada_max_kph.filter(v => v !== null)), radiacao_solar_total: totalRad }; }); 
-                atualizarGraficos(currentFilteredData, currentDailyAggregated); atualizarMapa(); renderCalendar(calendarDate); generateAndRenderHistoricalAlerts(currentFilteredData); generateAndRenderFutureAlerts(); updateForecastDisplay(); document.getElementById('daily-details-container').style.display = 'none'; selectedCalendarDay = null; 
+                const diario = Object.keys(dailyData).sort().map(day => { const d = dailyData[day]; const totalPrecip = Object.values(d.precip_by_station).reduce((a,b) => a+b, 0); const totalRad = d.radiacao_solar_acc.reduce((a,b)=>a+b, 0); return { data_str: day, precip_by_station: d.precip_by_station, precipitacao_mm: totalPrecip, precipitacao_media_mm: totalPrecip / numStations, temp_min_c: Math.min(...d.temp_min_c.filter(v => v !== null)), temp_max_c: Math.max(...d.temp_max_c.filter(v => v !== null)), temp_media_c: avg(d.temp_media_c.filter(v => v !== null)), umidade_min_perc: Math.min(...d.umidade_min_perc.filter(v => v !== null)), umidade_max_perc: Math.max(...d.umidade_max_perc.filter(v => v !== null)), umidade_media_perc: avg(d.umidade_media_perc.filter(v => v !== null)), vento_medio_kph: avg(d.vento_medio_kph.filter(v => v !== null)), rajada_max_kph: Math.max(0, ...d.rajada_max_kph.filter(v => v !== null)), radiacao_solar_total: totalRad }; }); 
+
+                const chuvaPorEstacao = {}; data.forEach(d => { chuvaPorEstacao[d.nome_estacao] = (chuvaPorEstacao[d.nome_estacao] || 0) + (d.precipitacao_mm || 0); });
+                const validWind = data.filter(d => d.vento_medio_kph !== null && !isNaN(d.vento_medio_kph)); const validGust = data.filter(d => d.rajada_max_kph !== null && !isNaN(d.rajada_max_kph));
+                const ventoPorMes = {}; validWind.forEach(d => { const month = d.datetime.getUTCFullYear() + '-' + String(d.datetime.getUTCMonth()+1).padStart(2,'0'); if(!ventoPorMes[month]) ventoPorMes[month] = []; ventoPorMes[month].push(d.vento_medio_kph); });
+                const ventoMensal = {}; for (const month in ventoPorMes) ventoMensal[month] = avg(ventoPorMes[month]);
+
+                // Direção x faixa de velocidade: faixas da rosa, depois 'acima da última faixa' e 'sem velocidade' (só entram nos totais)
+                const speedBrackets = [[0,3], [3,6], [6,9], [9,100]];
+                const direcaoVelocidade = CARDINAL_DIRECTIONS.map(() => Array(speedBrackets.length + 2).fill(0));
+                data.forEach(d => { const cardinal = degreesToCardinal(d.vento_direcao_graus); if (!cardinal) return; const speed = d.vento_medio_kph; let faixa = speedBrackets.length + 1; if (speed >= 0) { faixa = speedBrackets.findIndex(b => speed >= b[0] && speed < b[1]); if (faixa < 0) faixa = speedBrackets.length; } direcaoVelocidade[CARDINAL_DIRECTIONS.indexOf(cardinal)][faixa]++; });
+
+                const pulverizacaoMensal = {}; data.forEach(d => { const monthKey = d.datetime.getUTCFullYear() + '-' + String(d.datetime.getUTCMonth() + 1).padStart(2, '0'); if (!pulverizacaoMensal[monthKey]) pulverizacaoMensal[monthKey] = { Ideal: 0, Atenção: 0, Evitar: 0, NoData: 0 }; pulverizacaoMensal[monthKey][getSprayingCondition(d.vento_medio_kph, d.delta_t)]++; });
+                const porHora = { vento_medio_kph: Array(24).fill(0).map(()=>[]), delta_t: Array(24).fill(0).map(()=>[]), gfdi: Array(24).fill(0).map(()=>[]) };
+                data.forEach(d => { const hour = d.datetime.getUTCHours(); for (const key in porHora) { if (d[key] !== null && !isNaN(d[key])) porHora[key][hour].push(d[key]); } });
+                const perfilHora = {}; for (const key in porHora) perfilHora[key] = porHora[key].map(h => h.length > 0 ? avg(h) : null);
+
+                const dataInicioRad = new Date(INICIO_RADIACAO + 'T00:00:00Z');
+                const radiacaoDetalhada = data.filter(d => d.datetime >= dataInicioRad).sort((a,b) => a.datetime - b.datetime);
+                const radPorHora = Array(24).fill(0).map(() => []);
+                radiacaoDetalhada.forEach(d => { if (d.radiacao_solar !== null) radPorHora[d.datetime.getUTCHours()].push(d.radiacao_solar); });
+
+                const dailyDataByStation = {};
+                data.forEach(d => {
+                    const dayStr = d.datetime.toISOString().split('T')[0];
+                    const station = d.nome_estacao;
+                    const key = `${dayStr}|${station}`;
+                    if (!dailyDataByStation[key]) { dailyDataByStation[key] = { date: dayStr, station: station, precip: 0, gust: [], temp_max: [], temp_min: [], hum_min: [] }; }
+                    if (d.precipitacao_mm > 0) dailyDataByStation[key].precip += d.precipitacao_mm;
+                    if (d.rajada_max_kph) dailyDataByStation[key].gust.push(d.rajada_max_kph);
+                    if (d.temp_max_c) dailyDataByStation[key].temp_max.push(d.temp_max_c);
+                    if (d.temp_min_c) dailyDataByStation[key].temp_min.push(d.temp_min_c);
+                    if (d.umidade_min_perc) dailyDataByStation[key].hum_min.push(d.umidade_min_perc);
+                });
+                const diarioPorEstacao = Object.values(dailyDataByStation).map(day => ({ date: day.date, station: day.station, precip: day.precip, maxGust: day.gust.length > 0 ? Math.max(...day.gust) : 0, maxTemp: day.temp_max.length > 0 ? Math.max(...day.temp_max) : -Infinity, minTemp: day.temp_min.length > 0 ? Math.min(...day.temp_min) : Infinity, minHum: day.hum_min.length > 0 ? Math.min(...day.hum_min) : Infinity }));
+
+                return { diario, estacoes: [...new Set(data.map(d => d.nome_estacao))].sort(), chuvaPorEstacao, ventoMedio: validWind.reduce((s,d)=>s + d.vento_medio_kph, 0) / (validWind.length || 1), rajadaMax: validGust.reduce((m,d) => Math.max(m, d.rajada_max_kph), 0), ventoMensal, direcaoVelocidade, pulverizacaoMensal, perfilHora, radiacaoHora: radPorHora.map(vals => vals.length ? avg(vals) : 0), radiacaoDetalhada, diarioPorEstacao };
             }
-            function atualizarGraficos(data, dailyAggregated) { if(allData.length > 0 && data.length === 0) { return; } const stationsInFilter = [...new Set(data.map(d => d.nome_estacao))].sort(); const dateLabels = dailyAggregated.map(d => d.data_str); const rainByStation = {}; data.forEach(d => { if(d.precipitacao_mm > 0) rainByStation[d.nome_estacao] = (rainByStation[d.nome_estacao] || 0) + d.precipitacao_mm; }); const stationsWithRain = Object.values(rainByStation); const avgAccumulatedRain = stationsWithRain.length > 0 ? stationsWithRain.reduce((a,b) => a+b, 0) / stationsWithRain.length : 0; const maxChuva24h = Math.max(0, ...dailyAggregated.map(d => Math.max(0, ...Object.values(d.precip_by_station)))); document.getElementById('kpi-chuva').innerText = fNum(avgAccumulatedRain); document.getElementById('kpi-chuva-media').innerText = fNum(dailyAggregated.reduce((s, d) => s + d.precipitacao_media_mm, 0) / (dailyAggregated.length || 1)); document.getElementById('kpi-max-chuva-24h').innerText = fNum(maxChuva24h); document.getElementById('kpi-dias-chuva').innerText = dailyAggregated.filter(d => d.precipitacao_media_mm > 1).length; const validTemps = dailyAggregated.filter(d => !isNaN(d.temp_media_c)); if (validTemps.length > 0) { document.getElementById('kpi-temp-max').innerText = fNum(Math.max(...validTemps.map(d => d.temp_max_c))); document.getElementById('kpi-temp-media').innerText = fNum(validTemps.reduce((s, d) => s + d.temp_media_c, 0) / validTemps.length); document.getElementById('kpi-temp-min').innerText = fNum(Math.min(...validTemps.map(d => d.temp_min_c))); } const validHumidity = dailyAggregated.filter(d => !isNaN(d.umidade_media_perc)); if (validHumidity.length > 0) { document.getElementById('kpi-umidade-max').innerText = fNum(Math.max(...validHumidity.map(d => d.umidade_max_perc)), 0); document.getElementById('kpi-umidade-media').innerText = fNum(validHumidity.reduce((s,d)=>s+d.umidade_media_perc,0)/validHumidity.length, 0); document.getElementById('kpi-umidade-min').innerText = fNum(Math.min(...validHumidity.map(d => d.umidade_min_perc)), 0); }
-                charts.chuvaDiaria.data.labels = dateLabels; charts.chuvaDiaria.data.datasets = stationsInFilter.map(station => ({ label: station, data: dailyAggregated.map(day => day.precip_by_station[station] || 0), backgroundColor: stationColors[station] || '#64ffda', })); charts.chuvaDiaria.update(); const monthlyRain = {}; dailyAggregated.forEach(d => { const month = d.data_str.substring(0, 7); if (!monthlyRain[month]) monthlyRain[month] = {}; for(const station in d.precip_by_station){ monthlyRain[month][station] = (monthlyRain[month][station] || 0) + d.precip_by_station[station]; } }); const monthlyLabels = Object.keys(monthlyRain).sort(); charts.chuvaMensal.data.labels = monthlyLabels; charts.chuvaMensal.data.datasets = stationsInFilter.map(station => ({ label: station, data: monthlyLabels.map(month => (monthlyRain[month] && monthlyRain[month][station]) || 0), backgroundColor: stationColors[station] || '#64ffda', })); charts.chuvaMensal.update(); const dataEstacao = {}; data.forEach(d => { dataEstacao[d.nome_estacao] = (dataEstacao[d.nome_estacao] || 0) + (d.precipitacao_mm || 0); }); charts.chuvaEstacao.data.labels = Object.keys(dataEstacao); charts.chuvaEstacao.data.datasets = [{ label: 'Precipitação Total (mm)', data: Object.values(dataEstacao), backgroundColor: Object.keys(dataEstacao).map(s => stationColors[s]) }]; charts.chuvaEstacao.update();
-                charts.temperatura.data.labels = dateLabels; charts.temperatura.data.datasets = [ { label: 'Temp. Máxima (°C)', data: dailyAggregated.map(d=>d.temp_max_c), borderColor: '#ff6384', fill: false, tension: 0.1 }, { label: 'Temp. Média (°C)', data: dailyAggregated.map(d=>d.temp_media_c), borderColor: '#ffce56', fill: false, tension: 0.1, borderDash: [5, 5] }, { label: 'Temp. Mínima (°C)', data: dailyAggregated.map(d=>d.temp_min_c), borderColor: '#36a2eb', fill: true, backgroundColor: 'rgba(54, 162, 235, 0.2)', tension: 0.1 } ]; charts.temperatura.update(); charts.umidade.data.labels = dateLabels; charts.umidade.data.datasets = [ { label: 'Umidade Máxima (%)', data: dailyAggregated.map(d=>d.umidade_max_perc), borderColor: '#4bc0c0', fill: false, tension: 0.1 }, { label: 'Umidade Média (%)', data: dailyAggregated.map(d=>d.umidade_media_perc), borderColor: '#9966ff', fill: false, tension: 0.1, borderDash: [5, 5] }, { label: 'Umidade Mínima (%)', data: dailyAggregated.map(d=>d.umidade_min_perc), borderColor: '#c9cbcf', fill: true, backgroundColor: 'rgba(75, 192, 192, 0.2)', tension: 0.1 } ]; charts.umidade.update(); const validWind = data.filter(d => d.vento_medio_kph !== null && !isNaN(d.vento_medio_kph)); const validGust = data.filter(d => d.rajada_max_kph !== null && !isNaN(d.rajada_max_kph)); document.getElementById('kpi-vento-medio').innerText = fNum(validWind.reduce((s,d)=>s + d.vento_medio_kph, 0) / (validWind.length || 1)); document.getElementById('kpi-rajada-max').innerText = fNum(Math.max(0, ...validGust.map(d=>d.rajada_max_kph))); const dataVentoMensal = {}; data.forEach(d=> { if (d.vento_medio_kph !== null && !isNaN(d.vento_medio_kph)) { const month = d.datetime.getUTCFullYear() + '-' + String(d.datetime.getUTCMonth()+1).padStart(2,'0'); if(!dataVentoMensal[month]) dataVentoMensal[month] = []; dataVentoMensal[month].push(d.vento_medio_kph); }}); const labelsVentoMensal = Object.keys(dataVentoMensal).sort(); charts.ventoMensal.data.labels = labelsVentoMensal.map(l => { const [y,m] = l.split('-'); return `${MESES_PT_BR[m-1].substring(0,3)} ${y}`; }); charts.ventoMensal.data.datasets = [{ label: 'Vento Médio (km/h)', data: labelsVentoMensal.map(l => dataVentoMensal[l].reduce((a,b)=>a+b,0)/dataVentoMensal[l].length), backgroundColor: '#36a2eb' }]; charts.ventoMensal.update(); charts.ventoDiario.data.labels = dateLabels; charts.ventoDiario.data.datasets = [ { label: 'Rajada Máxima (km/h)', data: dailyAggregated.map(d => d.rajada_max_kph), borderColor: '#4bc0c0', fill: false, tension: 0.4 }, { label: 'Vento Médio (km/h)', data: dailyAggregated.map(d => d.vento_medio_kph), borderColor: '#36a2eb', fill: true, backgroundColor: 'rgba(54, 162, 235, 0.1)', tension: 0.4 } ]; charts.ventoDiario.update(); const direcaoCounts = {}; CARDINAL_DIRECTIONS.forEach(dir => direcaoCounts[dir] = 0); let totalDirecoes = 0; data.forEach(d => { const cardinal = degreesToCardinal(d.vento_direcao_graus); if (cardinal) { direcaoCounts[cardinal]++; totalDirecoes++; } }); charts.ventoDirecao.data.labels = CARDINAL_DIRECTIONS; charts.ventoDirecao.data.datasets = [{ label: 'Frequência (%)', data: CARDINAL_DIRECTIONS.map(d => (direcaoCounts[d]/(totalDirecoes || 1))*100), backgroundColor: Chart.getSpacedColors(16) }]; charts.ventoDirecao.update(); const horarioCounts = Array(24).fill(0).map(()=>[]); data.forEach(d => { if(d.vento_medio_kph !== null && !isNaN(d.vento_medio_kph)) horarioCounts[d.datetime.getUTCHours()].push(d.vento_medio_kph); }); charts.ventoHorario.data.labels = Array(24).fill(0).map((_,i)=>`${String(i).padStart(2,'0')}:00`); charts.ventoHorario.data.datasets = [{ label: 'Vento Médio (km/h)', data: horarioCounts.map(h=>h.length > 0 ? h.reduce((a,b)=>a+b,0)/h.length : 0), borderColor:'#9966ff', backgroundColor: 'rgba(153, 102, 255, 0.2)', fill: true, tension: 0.4 }]; charts.ventoHorario.update(); const speedBrackets = [[0,3], [3,6], [6,9], [9,100]]; const roseData = {}; CARDINAL_DIRECTIONS.forEach(dir => roseData[dir] = Array(speedBrackets.length).fill(0)); let totalVentos = 0; data.forEach(d => { const cardinal = degreesToCardinal(d.vento_direcao_graus); const speed = d.vento_medio_kph; if(cardinal && speed >= 0) { totalVentos++; for(let i=0; i<speedBrackets.length; i++) { if(speed >= speedBrackets[i][0] && speed < speedBrackets[i][1]) { roseData[cardinal][i]++; break; } } }}); charts.ventoRosa.data.labels = CARDINAL_DIRECTIONS; charts.ventoRosa.data.datasets = speedBrackets.map((bracket, i) => ({ label: `[${bracket[0]},${bracket[1]}) km/h`, data: CARDINAL_DIRECTIONS.map(dir => (roseData[dir][i]/(totalVentos || 1))*100) })); charts.ventoRosa.update();
-                const monthlyConditions = {}; data.forEach(d => { const monthKey = d.datetime.getUTCFullYear() + '-' + String(d.datetime.getUTCMonth() + 1).padStart(2, '0'); if (!monthlyConditions[monthKey]) monthlyConditions[monthKey] = { Ideal: 0, Atenção: 0, Evitar: 0, NoData: 0 }; const condition = getSprayingCondition(d.vento_medio_kph, d.delta_t); monthlyConditions[monthKey][condition]++; }); const monthlyLabelsSpray = Object.keys(monthlyConditions).sort(); charts.sprayConditionsByMonth.data.labels = monthlyLabelsSpray.map(l => { const [y, m] = l.split('-'); return `${MESES_PT_BR[parseInt(m)-1].substring(0,3)} ${y}`; }); charts.sprayConditionsByMonth.data.datasets = ['Ideal', 'Atenção', 'Evitar'].map(cond => ({ label: cond, data: monthlyLabelsSpray.map(m => { const total = Object.values(monthlyConditions[m]).reduce((a,b)=>a+b,0) - monthlyConditions[m].NoData; return total > 0 ? (monthlyConditions[m][cond] / total) * 100 : 0; }), backgroundColor: SPRAY_COLORS[cond] })); charts.sprayConditionsByMonth.update();
-                const hourlyDeltaT = Array(24).fill(0).map(()=>[]); const hourlyWind = Array(24).fill(0).map(()=>[]); data.forEach(d => { const hour = d.datetime.getUTCHours(); if(d.delta_t !== null && !isNaN(d.delta_t)) hourlyDeltaT[hour].push(d.delta_t); if(d.vento_medio_kph !== null && !isNaN(d.vento_medio_kph)) hourlyWind[hour].push(d.vento_medio_kph); }); const hourLabels = Array(24).fill(0).map((_,i)=>`${String(i).padStart(2,'0')}:00`); charts.ventoDeltaTHorario.data.labels = hourLabels; charts.ventoDeltaTHorario.data.datasets = [ { label: 'Delta T Médio (°C)', data: hourlyDeltaT.map(h=>h.length > 0 ? h.reduce((a,b)=>a+b,0)/h.length : NaN), borderColor: '#ff6384', backgroundColor: 'rgba(255, 99, 132, 0.2)', yAxisID: 'y_deltat', fill: true, tension: 0.4 }, { label: 'Vento Médio (km/h)', data: hourlyWind.map(h=>h.length > 0 ? h.reduce((a,b)=>a+b,0)/h.length : NaN), borderColor: '#36a2eb', backgroundColor: 'rgba(54, 162, 235, 0.2)', yAxisID: 'y_vento', fill: true, tension: 0.4 } ]; charts.ventoDeltaTHorario.update();
-                const hourlyGFDI = Array(24).fill(0).map(()=>[]); data.forEach(d => { if(d.gfdi !== null && !isNaN(d.gfdi)) hourlyGFDI[d.datetime.getUTCHours()].push(d.gfdi); }); charts.gfdiHorario.data.labels = hourLabels; charts.gfdiHorario.data.datasets = [{ label: 'GFDI Médio', data: hourlyGFDI.map(h=>h.length > 0 ? h.reduce((a,b)=>a+b,0)/h.length : NaN), borderColor:'#ffc107', backgroundColor: 'rgba(255, 193, 7, 0.2)', fill: true, tension: 0.4 }]; charts.gfdiHorario.update();
+            // O mesmo resumo com as agregações feitas no servidor local (/serie_diaria, /agregado_estacoes, /perfil_horario, /horario)
+            function resumoServidor(inicio, fim, station, numStations, signal) {
+                const filtro = { inicio, fim, estacao: station };
+                const inicioRad = inicio > INICIO_RADIACAO ? inicio : INICIO_RADIACAO;
+                return Promise.all([
+                    consultarServidor('serie_diaria', filtro, signal),
+                    consultarServidor('agregado_estacoes', filtro, signal),
+                    consultarServidor('perfil_horario', filtro, signal),
+                    consultarServidor('perfil_horario', { ...filtro, inicio: inicioRad, metricas: 'radiacao_solar' }, signal),
+                    consultarServidor('horario', { ...filtro, inicio: inicioRad, colunas: 'radiacao_solar' }, signal),
+                ]).then(([serie, porEstacao, perfil, perfilRad, horasRad]) => {
+                    const comb = serie.combinado, porEst = serie.por_estacao;
+                    const valor = (key, k, vazio) => { const v = (comb[key] || [])[k]; return v === null || v === undefined ? vazio : v; };
+                    const chuvaEstacaoDia = porEst.precipitacao_mm || {};
+                    const diario = serie.datas.map((day, k) => {
+                        const precip_by_station = {}; for (const name in chuvaEstacaoDia) { if (chuvaEstacaoDia[name][k] > 0) precip_by_station[name] = chuvaEstacaoDia[name][k]; }
+                        const totalPrecip = valor('precipitacao_mm', k, 0);
+                        return { data_str: day, precip_by_station, precipitacao_mm: totalPrecip, precipitacao_media_mm: totalPrecip / numStations, temp_min_c: valor('temp_min_c', k, Infinity), temp_max_c: valor('temp_max_c', k, -Infinity), temp_media_c: valor('temp_media_c', k, NaN), umidade_min_perc: valor('umidade_min_perc', k, Infinity), umidade_max_perc: valor('umidade_max_perc', k, -Infinity), umidade_media_perc: valor('umidade_media_perc', k, NaN), vento_medio_kph: valor('vento_medio_kph', k, NaN), rajada_max_kph: valor('rajada_max_kph', k, 0), radiacao_solar_total: valor('radiacao_solar', k, 0) };
+                    });
+
+                    const chuvaPorEstacao = {}; let somaVento = 0, nVento = 0, rajadaMax = 0;
+                    for (const name in porEstacao) { const m = porEstacao[name]; chuvaPorEstacao[name] = m.precipitacao_mm ? m.precipitacao_mm.valor : 0; if (m.vento_medio_kph) { somaVento += m.vento_medio_kph.valor * m.vento_medio_kph.n; nVento += m.vento_medio_kph.n; } if (m.rajada_max_kph) rajadaMax = Math.max(rajadaMax, m.rajada_max_kph.valor); }
+
+                    // Médias mensais de vento ponderadas pelas horas válidas de cada dia; condições de pulverização somadas por mês
+                    const ventoSomaMes = {}, ventoHorasMes = {}, pulverizacaoMensal = {};
+                    serie.datas.forEach((day, k) => {
+                        const month = day.substring(0, 7); const nV = (serie.n.vento_medio_kph || [])[k] || 0;
+                        if (nV > 0) { ventoSomaMes[month] = (ventoSomaMes[month] || 0) + comb.vento_medio_kph[k] * nV; ventoHorasMes[month] = (ventoHorasMes[month] || 0) + nV; }
+                        if (!pulverizacaoMensal[month]) pulverizacaoMensal[month] = { Ideal: 0, Atenção: 0, Evitar: 0, NoData: 0 };
+                        sprayStats.condicoes.forEach((cond, c) => pulverizacaoMensal[month][cond] += serie.pulverizacao[k][c]);
+                    });
+                    const ventoMensal = {}; for (const month in ventoSomaMes) ventoMensal[month] = ventoSomaMes[month] / ventoHorasMes[month];
+
+                    const diarioPorEstacao = [];
+                    for (const name in chuvaEstacaoDia) {
+                        serie.datas.forEach((day, k) => {
+                            const v = key => (porEst[key] && porEst[key][name]) ? porEst[key][name][k] : null;
+                            if (['precipitacao_mm', 'rajada_max_kph', 'temp_max_c', 'temp_min_c', 'umidade_min_perc'].every(key => v(key) === null)) return;
+                            diarioPorEstacao.push({ date: day, station: name, precip: v('precipitacao_mm') || 0, maxGust: v('rajada_max_kph') ?? 0, maxTemp: v('temp_max_c') ?? -Infinity, minTemp: v('temp_min_c') ?? Infinity, minHum: v('umidade_min_perc') ?? Infinity });
+                        });
+                    }
+
+                    const perfilHora = {}; for (const key of ['vento_medio_kph', 'delta_t', 'gfdi']) perfilHora[key] = perfil.media_hora[key] || Array(24).fill(null);
+                    const radiacaoHora = (perfilRad.media_hora.radiacao_solar || Array(24).fill(null)).map(v => v ?? 0);
+                    const radiacaoDetalhada = horasRad.linhas.map(([dt, nome, rad]) => ({ datetime: new Date(dt), nome_estacao: nome, radiacao_solar: rad }));
+                    return { diario, estacoes: serie.estacoes, chuvaPorEstacao, ventoMedio: nVento > 0 ? somaVento / nVento : 0, rajadaMax, ventoMensal, direcaoVelocidade: perfil.direcao_velocidade, pulverizacaoMensal, perfilHora, radiacaoHora, radiacaoDetalhada, diarioPorEstacao };
+                });
+            }
+            function atualizarGraficos(resumo) { const dailyAggregated = resumo.diario; if(dailyAggregated.length === 0) { return; } const stationsInFilter = resumo.estacoes; const dateLabels = dailyAggregated.map(d => d.data_str); const stationsWithRain = Object.values(resumo.chuvaPorEstacao).filter(v => v > 0); const avgAccumulatedRain = stationsWithRain.length > 0 ? stationsWithRain.reduce((a,b) => a+b, 0) / stationsWithRain.length : 0; const maxChuva24h = Math.max(0, ...dailyAggregated.map(d => Math.max(0, ...Object.values(d.precip_by_station)))); document.getElementById('kpi-chuva').innerText = fNum(avgAccumulatedRain); document.getElementById('kpi-chuva-media').innerText = fNum(dailyAggregated.reduce((s, d) => s + d.precipitacao_media_mm, 0) / (dailyAggregated.length || 1)); document.getElementById('kpi-max-chuva-24h').innerText = fNum(maxChuva24h); document.getElementById('kpi-dias-chuva').innerText = dailyAggregated.filter(d => d.precipitacao_media_mm > 1).length; const validTemps = dailyAggregated.filter(d => !isNaN(d.temp_media_c)); if (validTemps.length > 0) { document.getElementById('kpi-temp-max').innerText = fNum(Math.max(...validTemps.map(d => d.temp_max_c))); document.getElementById('kpi-temp-media').innerText = fNum(validTemps.reduce((s, d) => s + d.temp_media_c, 0) / validTemps.length); document.getElementById('kpi-temp-min').innerText = fNum(Math.min(...validTemps.map(d => d.temp_min_c))); } const validHumidity = dailyAggregated.filter(d => !isNaN(d.umidade_media_perc)); if (validHumidity.length > 0) { document.getElementById('kpi-umidade-max').innerText = fNum(Math.max(...validHumidity.map(d => d.umidade_max_perc)), 0); document.getElementById('kpi-umidade-media').innerText = fNum(validHumidity.reduce((s,d)=>s+d.umidade_media_perc,0)/validHumidity.length, 0); document.getElementById('kpi-umidade-min').innerText = fNum(Math.min(...validHumidity.map(d => d.umidade_min_perc)), 0); }
+                charts.chuvaDiaria.data.labels = dateLabels; charts.chuvaDiaria.data.datasets = stationsInFilter.map(station => ({ label: station, data: dailyAggregated.map(day => day.precip_by_station[station] || 0), backgroundColor: stationColors[station] || '#64ffda', })); charts.chuvaDiaria.update(); const monthlyRain = {}; dailyAggregated.forEach(d => { const month = d.data_str.substring(0, 7); if (!monthlyRain[month]) monthlyRain[month] = {}; for(const station in d.precip_by_station){ monthlyRain[month][station] = (monthlyRain[month][station] || 0) + d.precip_by_station[station]; } }); const monthlyLabels = Object.keys(monthlyRain).sort(); charts.chuvaMensal.data.labels = monthlyLabels; charts.chuvaMensal.data.datasets = stationsInFilter.map(station => ({ label: station, data: monthlyLabels.map(month => (monthlyRain[month] && monthlyRain[month][station]) || 0), backgroundColor: stationColors[station] || '#64ffda', })); charts.chuvaMensal.update(); const dataEstacao = resumo.chuvaPorEstacao; charts.chuvaEstacao.data.labels = Object.keys(dataEstacao); charts.chuvaEstacao.data.datasets = [{ label: 'Precipitação Total (mm)', data: Object.values(dataEstacao), backgroundColor: Object.keys(dataEstacao).map(s => stationColors[s]) }]; charts.chuvaEstacao.update();
+                charts.temperatura.data.labels = dateLabels; charts.temperatura.data.datasets = [ { label: 'Temp. Máxima (°C)', data: dailyAggregated.map(d=>d.temp_max_c), borderColor: '#ff6384', fill: false, tension: 0.1 }, { label: 'Temp. Média (°C)', data: dailyAggregated.map(d=>d.temp_media_c), borderColor: '#ffce56', fill: false, tension: 0.1, borderDash: [5, 5] }, { label: 'Temp. Mínima (°C)', data: dailyAggregated.map(d=>d.temp_min_c), borderColor: '#36a2eb', fill: true, backgroundColor: 'rgba(54, 162, 235, 0.2)', tension: 0.1 } ]; charts.temperatura.update(); charts.umidade.data.labels = dateLabels; charts.umidade.data.datasets = [ { label: 'Umidade Máxima (%)', data: dailyAggregated.map(d=>d.umidade_max_perc), borderColor: '#4bc0c0', fill: false, tension: 0.1 }, { label: 'Umidade Média (%)', data: dailyAggregated.map(d=>d.umidade_media_perc), borderColor: '#9966ff', fill: false, tension: 0.1, borderDash: [5, 5] }, { label: 'Umidade Mínima (%)', data: dailyAggregated.map(d=>d.umidade_min_perc), borderColor: '#c9cbcf', fill: true, backgroundColor: 'rgba(75, 192, 192, 0.2)', tension: 0.1 } ]; charts.umidade.update(); document.getElementById('kpi-vento-medio').innerText = fNum(resumo.ventoMedio); document.getElementById('kpi-rajada-max').innerText = fNum(resumo.rajadaMax); const dataVentoMensal = resumo.ventoMensal; const labelsVentoMensal = Object.keys(dataVentoMensal).sort(); charts.ventoMensal.data.labels = labelsVentoMensal.map(l => { const [y,m] = l.split('-'); return `${MESES_PT_BR[m-1].substring(0,3)} ${y}`; }); charts.ventoMensal.data.datasets = [{ label: 'Vento Médio (km/h)', data: labelsVentoMensal.map(l => dataVentoMensal[l]), backgroundColor: '#36a2eb' }]; charts.ventoMensal.update(); charts.ventoDiario.data.labels = dateLabels; charts.ventoDiario.data.datasets = [ { label: 'Rajada Máxima (km/h)', data: dailyAggregated.map(d => d.rajada_max_kph), borderColor: '#4bc0c0', fill: false, tension: 0.4 }, { label: 'Vento Médio (km/h)', data: dailyAggregated.map(d => d.vento_medio_kph), borderColor: '#36a2eb', fill: true, backgroundColor: 'rgba(54, 162, 235, 0.1)', tension: 0.4 } ]; charts.ventoDiario.update(); const direcaoCounts = {}; CARDINAL_DIRECTIONS.forEach((dir, i) => direcaoCounts[dir] = resumo.direcaoVelocidade[i].reduce((a, b) => a + b, 0)); const totalDirecoes = Object.values(direcaoCounts).reduce((a, b) => a + b, 0); charts.ventoDirecao.data.labels = CARDINAL_DIRECTIONS; charts.ventoDirecao.data.datasets = [{ label: 'Frequência (%)', data: CARDINAL_DIRECTIONS.map(d => (direcaoCounts[d]/(totalDirecoes || 1))*100), backgroundColor: Chart.getSpacedColors(16) }]; charts.ventoDirecao.update(); charts.ventoHorario.data.labels = Array(24).fill(0).map((_,i)=>`${String(i).padStart(2,'0')}:00`); charts.ventoHorario.data.datasets = [{ label: 'Vento Médio (km/h)', data: resumo.perfilHora.vento_medio_kph.map(v => v ?? 0), borderColor:'#9966ff', backgroundColor: 'rgba(153, 102, 255, 0.2)', fill: true, tension: 0.4 }]; charts.ventoHorario.update(); const speedBrackets = [[0,3], [3,6], [6,9], [9,100]]; const roseData = {}; CARDINAL_DIRECTIONS.forEach((dir, i) => roseData[dir] = resumo.direcaoVelocidade[i].slice(0, speedBrackets.length)); const totalVentos = resumo.direcaoVelocidade.reduce((s, linha) => s + linha.slice(0, speedBrackets.length + 1).reduce((a, b) => a + b, 0), 0); charts.ventoRosa.data.labels = CARDINAL_DIRECTIONS; charts.ventoRosa.data.datasets = speedBrackets.map((bracket, i) => ({ label: `[${bracket[0]},${bracket[1]}) km/h`, data: CARDINAL_DIRECTIONS.map(dir => (roseData[dir][i]/(totalVentos || 1))*100) })); charts.ventoRosa.update();
+                const monthlyConditions = resumo.pulverizacaoMensal; const monthlyLabelsSpray = Object.keys(monthlyConditions).sort(); charts.sprayConditionsByMonth.data.labels = monthlyLabelsSpray.map(l => { const [y, m] = l.split('-'); return `${MESES_PT_BR[parseInt(m)-1].substring(0,3)} ${y}`; }); charts.sprayConditionsByMonth.data.datasets = ['Ideal', 'Atenção', 'Evitar'].map(cond => ({ label: cond, data: monthlyLabelsSpray.map(m => { const total = Object.values(monthlyConditions[m]).reduce((a,b)=>a+b,0) - monthlyConditions[m].NoData; return total > 0 ? (monthlyConditions[m][cond] / total) * 100 : 0; }), backgroundColor: SPRAY_COLORS[cond] })); charts.sprayConditionsByMonth.update();
+                 const hourLabels = Array(24).fill(0).map((_,i)=>`${String(i).padStart(2,'0')}:00`); charts.ventoDeltaTHorario.data.labels = hourLabels; charts.ventoDeltaTHorario.data.datasets = [ { label: 'Delta T Médio (°C)', data: resumo.perfilHora.delta_t.map(v => v ?? NaN), borderColor: '#ff6384', backgroundColor: 'rgba(255, 99, 132, 0.2)', yAxisID: 'y_deltat', fill: true, tension: 0.4 }, { label: 'Vento Médio (km/h)', data: resumo.perfilHora.vento_medio_kph.map(v => v ?? NaN), borderColor: '#36a2eb', backgroundColor: 'rgba(54, 162, 235, 0.2)', yAxisID: 'y_vento', fill: true, tension: 0.4 } ]; charts.ventoDeltaTHorario.update();
+                 charts.gfdiHorario.data.labels = hourLabels; charts.gfdiHorario.data.datasets = [{ label: 'GFDI Médio', data: resumo.perfilHora.gfdi.map(v => v ?? NaN), borderColor:'#ffc107', backgroundColor: 'rgba(255, 193, 7, 0.2)', fill: true, tension: 0.4 }]; charts.gfdiHorario.update();
                 
                 // --- ATUALIZAÇÃO RADIAÇÃO (COM FILTRO RÍGIDO >= 05/11/2025) ---
-                const dataInicioRad = new Date('2025-11-05T00:00:00Z');
 
                 // 1. Filtra os dados agregados por dia para mostrar apenas >= 05/11/2025
-                const radDailyData = dailyAggregated.filter(d => d.data_str >= '2025-11-05');
+                const radDailyData = dailyAggregated.filter(d => d.data_str >= INICIO_RADIACAO);
                 const labelsDia = radDailyData.map(d => d.data_str);
                 const dataRadDia = radDailyData.map(d => d.radiacao_solar_total);
                 
-                // 2. Filtra os dados brutos (horários) para mostrar médias apenas >= 05/11/2025
-                const radRawData = data.filter(d => d.datetime >= dataInicioRad);
-                const radPorHora = Array(24).fill(0).map(() => []);
-                radRawData.forEach(d => { if (d.radiacao_solar !== null) radPorHora[d.datetime.getUTCHours()].push(d.radiacao_solar); });
-                const dataRadHoraMedia = radPorHora.map(vals => vals.length ? vals.reduce((a,b)=>a+b,0)/vals.length : 0);
-                
-                // 3. Garante que os dados detalhados estejam ordenados cronologicamente
-                const radRawSorted = radRawData.sort((a,b) => a.datetime - b.datetime);
+                // 2. Médias por hora e série horária (>= 05/11/2025, em ordem cronológica) já vêm no resumo
+                const dataRadHoraMedia = resumo.radiacaoHora;
+                const radRawSorted = resumo.radiacaoDetalhada;
                 const labelsDetalhado = radRawSorted.map(d => { const dt = d.datetime; return `${dt.getUTCDate()}/${dt.getUTCMonth()+1} ${dt.getUTCHours()}h`; });
                 const dataRadDetalhado = radRawSorted.map(d => d.radiacao_solar || 0);
 
@@ -557,38 +1240,53 @@ class RelatorioClimaCompleto:
                 // Atualiza o gráfico detalhado com os dados estritamente filtrados e ordenados
                 charts.radDetalhado.data.labels = labelsDetalhado; charts.radDetalhado.data.datasets[0].data = dataRadDetalhado; charts.radDetalhado.update();
             }
-            function renderCalendar(date) { const year = date.getUTCFullYear(); const month = date.getUTCMonth(); document.getElementById('month-year-header').innerText = `${MESES_PT_BR[month]} de ${year}`; const grid = document.getElementById('calendar-grid'); grid.innerHTML = ''; const firstDay = new Date(Date.UTC(year, month, 1)).getUTCDay(); const daysInMonth = new Date(Date.UTC(year, month + 1, 0)).getUTCDate(); const today = new Date(); const todayStr = today.toISOString().split('T')[0]; const selectedStation = document.getElementById('station-filter').value; for (let i = 0; i < firstDay; i++) { grid.innerHTML += '<div class="calendar-day empty"></div>'; } for (let i = 1; i <= daysInMonth; i++) { const dayStr = `${year}-${String(month + 1).padStart(2, '0')}-${String(i).padStart(2, '0')}`; const dayData = currentDailyAggregated.find(d => d.data_str === dayStr); const dayEl = document.createElement('div'); dayEl.className = 'calendar-day'; if (dayStr === todayStr) dayEl.classList.add('today'); if (dayStr === selectedCalendarDay) dayEl.classList.add('selected'); let content = `<div class="day-number">${i}</div>`; if (dayData && dayData.precipitacao_mm > 0) { if (selectedStation === 'todas') { content += '<div class="day-rainfall-details">'; for (const stationName in dayData.precip_by_station) { const rain = dayData.precip_by_station[stationName]; content += `<div class="station-rain"><span>${stationName.substring(0,8)}</span> ${fNum(rain)} mm</div>`; } content += '</div>'; } else { content += `<div class="day-rainfall">${fNum(dayData.precipitacao_mm)} mm</div>`; } } dayEl.innerHTML = content; dayEl.addEventListener('click', () => showDailyDetails(dayStr, currentFilteredData)); grid.appendChild(dayEl); } }
-            function renderSprayingWindow(hourlyData) { const container = document.getElementById('spraying-window-container'); container.innerHTML = ''; const barDiv = document.createElement('div'); barDiv.className = 'spraying-window-bar'; const axisDiv = document.createElement('div'); axisDiv.className = 'spraying-window-axis'; const dataMap = new Map(hourlyData.map(d => [d.datetime.getUTCHours(), d])); let restrictions = { wind_low: 0, wind_high: 0, delta_low: 0, delta_high: 0 }; for (let h = 0; h < 24; h++) { const hourData = dataMap.get(h); const wind = hourData ? hourData.vento_medio_kph : null; const deltaT = hourData ? hourData.delta_t : null; const condition = getSprayingCondition(wind, deltaT); if(condition === 'Evitar' || condition === 'Atenção'){ if(wind < 2) restrictions.wind_low++; if(wind > 9) restrictions.wind_high++; if(deltaT < 2) restrictions.delta_low++; if(deltaT > 10) restrictions.delta_high++; } const hourDiv = document.createElement('div'); hourDiv.className = 'spray-hour spray-hour-tooltip'; hourDiv.style.backgroundColor = SPRAY_COLORS[condition]; const windText = (wind !== null && !isNaN(wind)) ? `${fNum(wind, 1)} km/h` : 'N/D'; const deltaTText = (deltaT !== null && !isNaN(deltaT)) ? `${fNum(deltaT, 1)}` : 'N/D'; hourDiv.innerHTML = `<div class="spray-hour-content"><div class="spray-hour-time">${h}h</div><div class="spray-hour-value">ΔT: ${deltaTText}</div><div class="spray-hour-value">🌬️ ${windText}</div></div><span class="tooltip-text"><b>Hora: ${String(h).padStart(2,'0')}:00</b><br>Vento: ${windText}<br>ΔT: ${fNum(deltaT, 1)} °C</span>`; barDiv.appendChild(hourDiv); const axisLabel = document.createElement('div'); axisLabel.className = 'axis-label'; if (h % 3 === 0) { axisLabel.innerText = `${String(h).padStart(2,'0')}h`; } axisDiv.appendChild(axisLabel); } container.appendChild(barDiv); container.appendChild(axisDiv); let summaryText = "Condições ideais na maior parte do dia."; const maxRestriction = Object.keys(restrictions).reduce((a, b) => restrictions[a] > restrictions[b] ? a : b); if (restrictions[maxRestriction] > 3) { if(maxRestriction === 'wind_high') summaryText = "Principal restrição do dia: Vento forte (>9 km/h)."; else if(maxRestriction === 'delta_high') summaryText = "Principal restrição do dia: Delta T elevado (>10°C), alto risco de evaporação."; else if(maxRestriction === 'delta_low') summaryText = "Principal restrição do dia: Delta T baixo (<2°C), risco de escorrimento."; else if(maxRestriction === 'wind_low') summaryText = "Atenção: Períodos de vento muito baixo (<2 km/h), risco de inversão térmica."; } document.getElementById('spraying-summary').innerText = summaryText; }
-            function showDailyDetails(dateStr, data) { const hourlyDataForDay = data.filter(d => d.datetime.toISOString().split('T')[0] === dateStr); const detailsContainer = document.getElementById('daily-details-container'); if (hourlyDataForDay.length === 0) { detailsContainer.style.display = 'none'; selectedCalendarDay = null; renderCalendar(calendarDate); return; } selectedCalendarDay = dateStr; renderCalendar(calendarDate); const [y,m,d] = dateStr.split('-'); document.getElementById('selected-day-header').innerText = `Detalhes de ${d}/${m}/${y}`; const hours = Array(24).fill(0).map((_, i) => `${String(i).padStart(2,'0')}:00`); const hourlyRain = Array(24).fill(NaN), hourlyTemp = Array(24).fill(NaN), hourlyHum = Array(24).fill(NaN), hourlyWind = Array(24).fill(NaN), hourlyDeltaT = Array(24).fill(NaN); hourlyDataForDay.forEach(rec => { const hour = rec.datetime.getUTCHours(); hourlyRain[hour] = (hourlyRain[hour] || 0) + (rec.precipitacao_mm || 0); hourlyTemp[hour] = rec.temp_media_c; hourlyHum[hour] = rec.umidade_media_perc; hourlyWind[hour] = rec.vento_medio_kph; hourlyDeltaT[hour] = rec.delta_t; }); charts.chuvaHoraria.data.labels = hours; charts.chuvaHoraria.data.datasets = [{ label: 'Chuva (mm)', data: hourlyRain, backgroundColor: '#64ffda' }]; charts.chuvaHoraria.update(); charts.tempUmidadeDiario.data.labels = hours; charts.tempUmidadeDiario.data.datasets = [ { label: 'Temperatura (°C)', data: hourlyTemp, borderColor: '#ff9f40', yAxisID: 'y_temp', tension: 0.2 }, { label: 'Umidade (%)', data: hourlyHum, borderColor: '#4bc0c0', yAxisID: 'y_rh', tension: 0.2 } ]; charts.tempUmidadeDiario.update(); charts.ventoDeltaTDiario.data.labels = hours; charts.ventoDeltaTDiario.data.datasets = [ { label: 'Delta T (°C)', data: hourlyDeltaT, borderColor: '#ff6384', yAxisID: 'y_deltat', tension: 0.2 }, { label: 'Vento (km/h)', data: hourlyWind, borderColor: '#36a2eb', yAxisID: 'y_vento', tension: 0.2 } ]; charts.ventoDeltaTDiario.update(); const speedBrackets = [[0,3], [3,6], [6,9], [9,100]]; const roseData = {}; CARDINAL_DIRECTIONS.forEach(dir => roseData[dir] = Array(speedBrackets.length).fill(0)); let totalVentos = 0; hourlyDataForDay.forEach(d => { const cardinal = degreesToCardinal(d.vento_direcao_graus); const speed = d.vento_medio_kph; if(cardinal && speed >= 0) { totalVentos++; for(let i=0; i<speedBrackets.length; i++) { if(speed >= speedBrackets[i][0] && speed < speedBrackets[i][1]) { roseData[cardinal][i]++; break; } } } }); charts.ventoRosaDiario.data.labels = CARDINAL_DIRECTIONS; charts.ventoRosaDiario.data.datasets = speedBrackets.map((bracket, i) => ({ label: `[${bracket[0]},${bracket[1]}) km/h`, data: CARDINAL_DIRECTIONS.map(dir => (roseData[dir][i]/(totalVentos || 1))*100) })); charts.ventoRosaDiario.update(); renderSprayingWindow(hourlyDataForDay); detailsContainer.style.display = 'block'; }
-            function iniciarMapa() { if (!geoData || !geoData.fields || geoData.fields.length === 0) { document.getElementById('map-container').innerHTML = '<p style="text-align:center; padding-top: 50px;">Nenhum dado geográfico de talhão encontrado.</p>'; return; } const center = geoData.fields.length > 0 ? geoData.fields[0].centroid : [-14, -59]; map = L.map('map-container').setView(center, 12); const satelliteLayer = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', { attribution: 'Tiles &copy; Esri' }); const streetLayer = L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', { attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors' }).addTo(map); L.control.layers({"Ruas": streetLayer, "Satélite": satelliteLayer}, {}).addTo(map); geoData.fields.forEach(field => { const polygon = L.polygon(field.geometry.coordinates[0], { color: "#64ffda", weight: 2, opacity: 0.8, fillOpacity: 0.3 }); fieldLayers[field.field_id] = polygon; polygon.addTo(map); }); const stationIcon = L.divIcon({ html: '📡', className: 'station-icon', iconSize: [24, 24], iconAnchor: [12, 12] }); geoData.stations.forEach(station => { const marker = L.marker([station.latitude, station.longitude], { icon: stationIcon }).addTo(map); stationMarkers[station.name] = marker; }); mapLegend = L.control({position: 'bottomright'}); mapLegend.onAdd = function (map) { const div = L.DomUtil.create('div', 'info legend'); div.style.backgroundColor = 'rgba(17, 34, 64, 0.9)'; div.style.padding = '10px'; div.style.borderRadius = '5px'; div.style.color = '#e6f1ff'; return div; }; mapLegend.addTo(map); }
-            function atualizarMapa() { if (!map) return; const startDate = new Date(document.getElementById('start-date').value + "T00:00:00Z"); const endDate = new Date(document.getElementById('end-date').value + "T23:59:59Z"); const selectedMetric = document.getElementById('map-metric-selector').value; const config = mapMetricsConfig[selectedMetric]; const filteredData = allData.filter(d => d.datetime >= startDate && d.datetime <= endDate); if (filteredData.length === 0) { Object.values(fieldLayers).forEach(layer => layer.setStyle({ fillColor: 'grey', color: 'grey', fillOpacity: 0.1 })); updateMapLegend(0, 0, () => 'grey', config, startDate, endDate); return; } const stationData = {}; geoData.stations.forEach(s => { stationData[s.name] = { values: [], lat: s.latitude, lon: s.longitude }; }); filteredData.forEach(d => { if (stationData[d.nome_estacao] && typeof d[config.key] === 'number') { stationData[d.nome_estacao].values.push(d[config.key]); } }); const stationAggregates = []; for (const name in stationData) { const data = stationData[name]; let aggValue; if (data.values.length > 0) { if (config.agg === 'sum') aggValue = data.values.reduce((a, b) => a + b, 0); else if (config.agg === 'avg') aggValue = data.values.reduce((a, b) => a + b, 0) / data.values.length; else if (config.agg === 'max') aggValue = Math.max(...data.values); stationAggregates.push({ lat: data.lat, lon: data.lon, value: aggValue }); if (stationMarkers[name]) stationMarkers[name].bindPopup(`<b>Estação: ${name}</b><br>${config.label}: ${fNum(aggValue)} ${config.unit}`); } } if (stationAggregates.length === 0) { Object.values(fieldLayers).forEach(layer => layer.setStyle({ fillColor: 'grey', color: 'grey', fillOpacity: 0.1 })); updateMapLegend(0, 0, () => 'grey', config, startDate, endDate); return; } const fieldValues = []; geoData.fields.forEach(field => { const interpolatedValue = idwInterpolation(field.centroid[0], field.centroid[1], stationAggregates); if (!isNaN(interpolatedValue)) fieldValues.push(interpolatedValue); field.interpolatedValue = interpolatedValue; }); const minVal = fieldValues.length > 0 ? Math.min(...fieldValues) : 0; const maxVal = fieldValues.length > 0 ? Math.max(...fieldValues) : 0; const colorScale = createColorScale(minVal, maxVal, config.colors); geoData.fields.forEach(field => { const layer = fieldLayers[field.field_id]; if (layer) { const value = field.interpolatedValue; const color = !isNaN(value) ? colorScale(value) : 'grey'; layer.setStyle({ fillColor: color, color: color, weight: 1.5, fillOpacity: 0.6 }); layer.bindPopup(`<b>Talhão: ${field.field_name}</b><br>${config.label} (estimado): ${fNum(value)} ${config.unit}`); } }); updateMapLegend(minVal, maxVal, colorScale, config, startDate, endDate); }
+            function renderCalendar(date) { const year = date.getUTCFullYear(); const month = date.getUTCMonth(); document.getElementById('month-year-header').innerText = `${MESES_PT_BR[month]} de ${year}`; const grid = document.getElementById('calendar-grid'); grid.innerHTML = ''; const firstDay = new Date(Date.UTC(year, month, 1)).getUTCDay(); const daysInMonth = new Date(Date.UTC(year, month + 1, 0)).getUTCDate(); const today = new Date(); const todayStr = today.toISOString().split('T')[0]; const selectedStation = document.getElementById('station-filter').value; for (let i = 0; i < firstDay; i++) { grid.innerHTML += '<div class="calendar-day empty"></div>'; } for (let i = 1; i <= daysInMonth; i++) { const dayStr = `${year}-${String(month + 1).padStart(2, '0')}-${String(i).padStart(2, '0')}`; const dayData = currentDailyAggregated.find(d => d.data_str === dayStr); const dayEl = document.createElement('div'); dayEl.className = 'calendar-day'; if (dayStr === todayStr) dayEl.classList.add('today'); if (dayStr === selectedCalendarDay) dayEl.classList.add('selected'); let content = `<div class="day-number">${i}</div>`; if (dayData && dayData.precipitacao_mm > 0) { if (selectedStation === 'todas') { content += '<div class="day-rainfall-details">'; for (const stationName in dayData.precip_by_station) { const rain = dayData.precip_by_station[stationName]; content += `<div class="station-rain"><span>${stationName.substring(0,8)}</span> ${fNum(rain)} mm</div>`; } content += '</div>'; } else { content += `<div class="day-rainfall">${fNum(dayData.precipitacao_mm)} mm</div>`; } } dayEl.innerHTML = content; dayEl.addEventListener('click', () => showDailyDetails(dayStr)); grid.appendChild(dayEl); } }
+            function atualizarComparativoAnual(station) {
+                // Junta as três resoluções (mensal congelada, diária congelada e horária recente) em totais por estação e mês
+                const rainByStationMonth = {};
+                const add = (name, monthKey, value) => { if (typeof value !== 'number' || isNaN(value)) return; if (station !== 'todas' && name !== station) return; if (!rainByStationMonth[name]) rainByStationMonth[name] = {}; rainByStationMonth[name][monthKey] = (rainByStationMonth[name][monthKey] || 0) + value; };
+                historicoCamadas.mensal.forEach(d => add(d.nome_estacao, d.data, d.precipitacao_mm));
+                historicoCamadas.diario.forEach(d => add(d.nome_estacao, d.data.substring(0, 7), d.precipitacao_mm));
+                if (AGG_SERVER_URL === null) { allData.forEach(d => add(d.nome_estacao, d.datetime.toISOString().substring(0, 7), d.precipitacao_mm)); renderComparativoAnual(rainByStationMonth); return; }
+                const sinal = novoSinal('comparativo');
+                consultarServidor('serie_diaria', { periodo: 'mes', estacao: station }, sinal).then(serie => { if (sinal.aborted) return; const chuva = serie.por_estacao.precipitacao_mm || {}; for (const name in chuva) chuva[name].forEach((v, k) => add(name, serie.datas[k], v)); renderComparativoAnual(rainByStationMonth); }).catch(e => { if (e.name !== 'AbortError') console.error(e); });
+            }
+            function renderComparativoAnual(rainByStationMonth) {
+                const valuesByMonth = {}; Object.values(rainByStationMonth).forEach(months => { for (const monthKey in months) { if (!valuesByMonth[monthKey]) valuesByMonth[monthKey] = []; valuesByMonth[monthKey].push(months[monthKey]); } });
+                const years = [...new Set(Object.keys(valuesByMonth).map(k => k.substring(0, 4)))].sort(); const colors = Chart.getSpacedColors(years.length || 1);
+                charts.chuvaComparativoAnual.data.datasets = years.map((year, i) => ({ label: year, data: MESES_PT_BR.map((_, m) => { const values = valuesByMonth[`${year}-${String(m + 1).padStart(2, '0')}`]; return values ? values.reduce((a, b) => a + b, 0) / values.length : null; }), borderColor: colors[i], backgroundColor: colors[i], spanGaps: false, tension: 0.2 }));
+                charts.chuvaComparativoAnual.update();
+            }
+            function renderSprayingWindow(hourlyData) { const container = document.getElementById('spraying-window-container'); container.innerHTML = ''; const barDiv = document.createElement('div'); barDiv.className = 'spraying-window-bar'; const axisDiv = document.createElement('div'); axisDiv.className = 'spraying-window-axis'; const dataMap = new Map(hourlyData.map(d => [d.datetime.getUTCHours(), d])); let restrictions = { wind_low: 0, wind_high: 0, delta_low: 0, delta_high: 0 }; for (let h = 0; h < 24; h++) { const hourData = dataMap.get(h); const wind = hourData ? hourData.vento_medio_kph : null; const deltaT = hourData ? hourData.delta_t : null; const condition = getSprayingCondition(wind, deltaT); if(condition === 'Evitar' || condition === 'Atenção'){ if(wind < SPRAY_LIMITS.vento_min) restrictions.wind_low++; if(wind > SPRAY_LIMITS.vento_max) restrictions.wind_high++; if(deltaT < SPRAY_LIMITS.delta_t_min) restrictions.delta_low++; if(deltaT > SPRAY_LIMITS.delta_t_max) restrictions.delta_high++; } const hourDiv = document.createElement('div'); hourDiv.className = 'spray-hour spray-hour-tooltip'; hourDiv.style.backgroundColor = SPRAY_COLORS[condition]; const windText = (wind !== null && !isNaN(wind)) ? `${fNum(wind, 1)} km/h` : 'N/D'; const deltaTText = (deltaT !== null && !isNaN(deltaT)) ? `${fNum(deltaT, 1)}` : 'N/D'; hourDiv.innerHTML = `<div class="spray-hour-content"><div class="spray-hour-time">${h}h</div><div class="spray-hour-value">ΔT: ${deltaTText}</div><div class="spray-hour-value">🌬️ ${windText}</div></div><span class="tooltip-text"><b>Hora: ${String(h).padStart(2,'0')}:00</b><br>Vento: ${windText}<br>ΔT: ${fNum(deltaT, 1)} °C</span>`; barDiv.appendChild(hourDiv); const axisLabel = document.createElement('div'); axisLabel.className = 'axis-label'; if (h % 3 === 0) { axisLabel.innerText = `${String(h).padStart(2,'0')}h`; } axisDiv.appendChild(axisLabel); } container.appendChild(barDiv); container.appendChild(axisDiv); let summaryText = "Condições ideais na maior parte do dia."; const maxRestriction = Object.keys(restrictions).reduce((a, b) => restrictions[a] > restrictions[b] ? a : b); if (restrictions[maxRestriction] > 3) { if(maxRestriction === 'wind_high') summaryText = `Principal restrição do dia: Vento forte (>${SPRAY_LIMITS.vento_max} km/h).`; else if(maxRestriction === 'delta_high') summaryText = `Principal restrição do dia: Delta T elevado (>${SPRAY_LIMITS.delta_t_max}°C), alto risco de evaporação.`; else if(maxRestriction === 'delta_low') summaryText = `Principal restrição do dia: Delta T baixo (<${SPRAY_LIMITS.delta_t_min}°C), risco de escorrimento.`; else if(maxRestriction === 'wind_low') summaryText = `Atenção: Períodos de vento muito baixo (<${SPRAY_LIMITS.vento_min} km/h), risco de inversão térmica.`; } document.getElementById('spraying-summary').innerText = summaryText; }
+            function showDailyDetails(dateStr) {
+                if (AGG_SERVER_URL === null) { renderDailyDetails(dateStr, currentFilteredData.filter(d => d.datetime.toISOString().split('T')[0] === dateStr)); return; }
+                const sinal = novoSinal('detalhes');
+                consultarServidor('horario', { inicio: dateStr, fim: dateStr, estacao: document.getElementById('station-filter').value }, sinal)
+                    .then(res => { if (sinal.aborted) return; renderDailyDetails(dateStr, res.linhas.map(linha => { const d = {}; res.colunas.forEach((col, i) => d[col] = linha[i]); d.datetime = new Date(d.datetime); return d; })); })
+                    .catch(e => { if (e.name !== 'AbortError') console.error(e); });
+            }
+            function renderDailyDetails(dateStr, hourlyDataForDay) { const detailsContainer = document.getElementById('daily-details-container'); if (hourlyDataForDay.length === 0) { detailsContainer.style.display = 'none'; selectedCalendarDay = null; renderCalendar(calendarDate); return; } selectedCalendarDay = dateStr; renderCalendar(calendarDate); const [y,m,d] = dateStr.split('-'); document.getElementById('selected-day-header').innerText = `Detalhes de ${d}/${m}/${y}`; const hours = Array(24).fill(0).map((_, i) => `${String(i).padStart(2,'0')}:00`); const hourlyRain = Array(24).fill(NaN), hourlyTemp = Array(24).fill(NaN), hourlyHum = Array(24).fill(NaN), hourlyWind = Array(24).fill(NaN), hourlyDeltaT = Array(24).fill(NaN); hourlyDataForDay.forEach(rec => { const hour = rec.datetime.getUTCHours(); hourlyRain[hour] = (hourlyRain[hour] || 0) + (rec.precipitacao_mm || 0); hourlyTemp[hour] = rec.temp_media_c; hourlyHum[hour] = rec.umidade_media_perc; hourlyWind[hour] = rec.vento_medio_kph; hourlyDeltaT[hour] = rec.delta_t; }); charts.chuvaHoraria.data.labels = hours; charts.chuvaHoraria.data.datasets = [{ label: 'Chuva (mm)', data: hourlyRain, backgroundColor: '#64ffda' }]; charts.chuvaHoraria.update(); charts.tempUmidadeDiario.data.labels = hours; charts.tempUmidadeDiario.data.datasets = [ { label: 'Temperatura (°C)', data: hourlyTemp, borderColor: '#ff9f40', yAxisID: 'y_temp', tension: 0.2 }, { label: 'Umidade (%)', data: hourlyHum, borderColor: '#4bc0c0', yAxisID: 'y_rh', tension: 0.2 } ]; charts.tempUmidadeDiario.update(); charts.ventoDeltaTDiario.data.labels = hours; charts.ventoDeltaTDiario.data.datasets = [ { label: 'Delta T (°C)', data: hourlyDeltaT, borderColor: '#ff6384', yAxisID: 'y_deltat', tension: 0.2 }, { label: 'Vento (km/h)', data: hourlyWind, borderColor: '#36a2eb', yAxisID: 'y_vento', tension: 0.2 } ]; charts.ventoDeltaTDiario.update(); const speedBrackets = [[0,3], [3,6], [6,9], [9,100]]; const roseData = {}; CARDINAL_DIRECTIONS.forEach(dir => roseData[dir] = Array(speedBrackets.length).fill(0)); let totalVentos = 0; hourlyDataForDay.forEach(d => { const cardinal = degreesToCardinal(d.vento_direcao_graus); const speed = d.vento_medio_kph; if(cardinal && speed >= 0) { totalVentos++; for(let i=0; i<speedBrackets.length; i++) { if(speed >= speedBrackets[i][0] && speed < speedBrackets[i][1]) { roseData[cardinal][i]++; break; } } } }); charts.ventoRosaDiario.data.labels = CARDINAL_DIRECTIONS; charts.ventoRosaDiario.data.datasets = speedBrackets.map((bracket, i) => ({ label: `[${bracket[0]},${bracket[1]}) km/h`, data: CARDINAL_DIRECTIONS.map(dir => (roseData[dir][i]/(totalVentos || 1))*100) })); charts.ventoRosaDiario.update(); renderSprayingWindow(hourlyDataForDay); detailsContainer.style.display = 'block'; }
+            function iniciarMapa() { if (!geoData || !geoData.fields || geoData.fields.length === 0) { document.getElementById('map-container').innerHTML = '<p style="text-align:center; padding-top: 50px;">Nenhum dado geográfico de talhão encontrado.</p>'; return; } const center = geoData.fields.length > 0 ? geoData.fields[0].centroid : [-14, -59]; map = L.map('map-container').setView(center, 12); const satelliteLayer = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', { attribution: 'Tiles &copy; Esri' }); const streetLayer = L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', { attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors' }).addTo(map); L.control.layers({"Ruas": streetLayer, "Satélite": satelliteLayer}, {}).addTo(map); geoData.fields.forEach(field => { const polygon = L.polygon(decodeFieldGeometry(field.geometry), { color: "#64ffda", weight: 2, opacity: 0.8, fillOpacity: 0.3 }); fieldLayers[field.field_id] = polygon; polygon.addTo(map); }); const stationIcon = L.divIcon({ html: '📡', className: 'station-icon', iconSize: [24, 24], iconAnchor: [12, 12] }); geoData.stations.forEach(station => { const marker = L.marker([station.latitude, station.longitude], { icon: stationIcon }).addTo(map); stationMarkers[station.name] = marker; }); mapLegend = L.control({position: 'bottomright'}); mapLegend.onAdd = function (map) { const div = L.DomUtil.create('div', 'info legend'); div.style.backgroundColor = 'rgba(17, 34, 64, 0.9)'; div.style.padding = '10px'; div.style.borderRadius = '5px'; div.style.color = '#e6f1ff'; return div; }; mapLegend.addTo(map); }
+            function decodeFieldGeometry(geometry) { if (geometry.encoding !== 'delta') return geometry.coordinates; return geometry.coordinates.map(part => part.map(ring => { let lat = 0, lon = 0; return ring.map(([dLat, dLon]) => { lat += dLat; lon += dLon; return [lat / geometry.scale, lon / geometry.scale]; }); })); }
+            function atualizarMapa() { if (!map) return; const startDate = new Date(document.getElementById('start-date').value + "T00:00:00Z"); const endDate = new Date(document.getElementById('end-date').value + "T23:59:59Z"); const selectedMetric = document.getElementById('map-metric-selector').value; const config = mapMetricsConfig[selectedMetric]; if (AGG_SERVER_URL !== null) { const sinal = novoSinal('mapa'); consultarServidor('agregado', { metrica: config.key, agg: config.agg, inicio: document.getElementById('start-date').value, fim: document.getElementById('end-date').value }, sinal).then(res => { if (sinal.aborted) return; const aggregatesByStation = {}; for (const name in res) aggregatesByStation[name] = res[name].valor; aplicarAgregadosNoMapa(aggregatesByStation, config, startDate, endDate); }).catch(e => { if (e.name !== 'AbortError') aplicarAgregadosNoMapa(agregarEstacoesLocal(startDate, endDate, config), config, startDate, endDate); }); return; } aplicarAgregadosNoMapa(agregarEstacoesLocal(startDate, endDate, config), config, startDate, endDate); }
+            function agregarEstacoesLocal(startDate, endDate, config) { const filteredData = allData.filter(d => d.datetime >= startDate && d.datetime <= endDate); const stationData = {}; geoData.stations.forEach(s => { stationData[s.name] = []; }); filteredData.forEach(d => { if (stationData[d.nome_estacao] && typeof d[config.key] === 'number') { stationData[d.nome_estacao].push(d[config.key]); } }); const aggregatesByStation = {}; for (const name in stationData) { const values = stationData[name]; if (values.length > 0) { if (config.agg === 'sum') aggregatesByStation[name] = values.reduce((a, b) => a + b, 0); else if (config.agg === 'avg') aggregatesByStation[name] = values.reduce((a, b) => a + b, 0) / values.length; else if (config.agg === 'max') aggregatesByStation[name] = Math.max(...values); } } return aggregatesByStation; }
+            function aplicarAgregadosNoMapa(aggregatesByStation, config, startDate, endDate) { const stationAggregates = []; geoData.stations.forEach(s => { const aggValue = aggregatesByStation[s.name]; if (typeof aggValue !== 'number' || isNaN(aggValue)) return; stationAggregates.push({ lat: s.latitude, lon: s.longitude, value: aggValue }); if (stationMarkers[s.name]) stationMarkers[s.name].bindPopup(`<b>Estação: ${s.name}</b><br>${config.label}: ${fNum(aggValue)} ${config.unit}`); }); if (stationAggregates.length === 0) { Object.values(fieldLayers).forEach(layer => layer.setStyle({ fillColor: 'grey', color: 'grey', fillOpacity: 0.1 })); updateMapLegend(0, 0, () => 'grey', config, startDate, endDate); return; } const fieldValues = []; geoData.fields.forEach(field => { const interpolatedValue = idwInterpolation(field.centroid[0], field.centroid[1], stationAggregates); if (!isNaN(interpolatedValue)) fieldValues.push(interpolatedValue); field.interpolatedValue = interpolatedValue; }); const minVal = fieldValues.length > 0 ? Math.min(...fieldValues) : 0; const maxVal = fieldValues.length > 0 ? Math.max(...fieldValues) : 0; const colorScale = createColorScale(minVal, maxVal, config.colors); geoData.fields.forEach(field => { const layer = fieldLayers[field.field_id]; if (layer) { const value = field.interpolatedValue; const color = !isNaN(value) ? colorScale(value) : 'grey'; layer.setStyle({ fillColor: color, color: color, weight: 1.5, fillOpacity: 0.6 }); layer.bindPopup(`<b>Talhão: ${field.field_name}</b><br>${config.label} (estimado): ${fNum(value)} ${config.unit}`); } }); updateMapLegend(minVal, maxVal, colorScale, config, startDate, endDate); }
             function haversineDistance(lat1, lon1, lat2, lon2) { const R = 6371; const toRad = val => val * Math.PI / 180; const dLat = toRad(lat2 - lat1); const dLon = toRad(lon2 - lon1); const a = Math.sin(dLat / 2) * Math.sin(dLat / 2) + Math.cos(toRad(lat1)) * Math.cos(toRad(lat2)) * Math.sin(dLon / 2) * Math.sin(dLon / 2); const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a)); return R * c; }
             function idwInterpolation(targetLat, targetLon, stations, power = 2) { let n = 0, d = 0; for(const s of stations){ const dist = haversineDistance(targetLat, targetLon, s.lat, s.lon); if(dist < 0.001) return s.value; const w = 1.0 / Math.pow(dist, power); n += w * s.value; d += w; } return d > 0 ? n / d : NaN; }
             function createColorScale(min, max, colors) { return function(value) { if (value <= min) return colors[0]; if (value >= max) return colors[colors.length - 1]; const r = max - min; if (r < 1e-9) return colors[Math.floor(colors.length/2)]; const p = (value - min) / r; const i = Math.min(Math.floor(p * colors.length), colors.length - 1); return colors[i]; }; }
             function updateMapLegend(min, max, scale, config, start, end) { const div = mapLegend.getContainer(); const fDate = (d) => d.toLocaleDateString('pt-BR',{timeZone:'UTC'}); let html = `<h4>${config.label}</h4><p style="font-size:0.8em;margin:0 0 5px 0;">Período: ${fDate(start)} a ${fDate(end)}</p>`; let grades = []; const step = (max-min)/5; if(step<1e-9 || min===max){grades=[min]}else{for(let i=0;i<=5;i++){grades.push(min+i*step)}} if(grades.length===1){html+=`<i style="background:${scale(grades[0])};width:18px;height:18px;float:left;margin-right:8px;opacity:0.7;"></i> ${fNum(grades[0],1)} ${config.unit}<br>`}else{for(let i=0;i<grades.length-1;i++){const from=grades[i];const to=grades[i+1];html+=`<i style="background:${scale(from+step/2)};width:18px;height:18px;float:left;margin-right:8px;opacity:0.7;"></i> ${fNum(from,1)} &ndash; ${fNum(to,1)} ${config.unit}<br>`}} div.innerHTML = html; }
-            function generateAndRenderHistoricalAlerts(hourlyData) {
-                const dailyDataByStation = {};
-                hourlyData.forEach(d => {
-                    const dayStr = d.datetime.toISOString().split('T')[0];
-                    const station = d.nome_estacao;
-                    const key = `${dayStr}|${station}`;
-                    if (!dailyDataByStation[key]) { dailyDataByStation[key] = { date: dayStr, station: station, precip: 0, gust: [], temp_max: [], temp_min: [], hum_min: [] }; }
-                    if (d.precipitacao_mm > 0) dailyDataByStation[key].precip += d.precipitacao_mm;
-                    if (d.rajada_max_kph) dailyDataByStation[key].gust.push(d.rajada_max_kph);
-                    if (d.temp_max_c) dailyDataByStation[key].temp_max.push(d.temp_max_c);
-                    if (d.temp_min_c) dailyDataByStation[key].temp_min.push(d.temp_min_c);
-                    if (d.umidade_min_perc) dailyDataByStation[key].hum_min.push(d.umidade_min_perc);
-                });
+            function generateAndRenderHistoricalAlerts(diasPorEstacao) {
+                // Um registro por estação e dia (ver resumoLocal / resumoServidor)
                 const alertsByMonth = {};
-                for (const key in dailyDataByStation) {
-                    const dayData = dailyDataByStation[key]; const month = dayData.date.substring(0, 7); if (!alertsByMonth[month]) alertsByMonth[month] = [];
-                    const maxGust = dayData.gust.length > 0 ? Math.max(...dayData.gust) : 0; const maxTemp = dayData.temp_max.length > 0 ? Math.max(...dayData.temp_max) : -Infinity; const minTemp = dayData.temp_min.length > 0 ? Math.min(...dayData.temp_min) : Infinity; const minHum = dayData.hum_min.length > 0 ? Math.min(...dayData.hum_min) : Infinity;
+                diasPorEstacao.forEach(dayData => {
+                    const month = dayData.date.substring(0, 7); if (!alertsByMonth[month]) alertsByMonth[month] = [];
+                    const maxGust = dayData.maxGust; const maxTemp = dayData.maxTemp; const minTemp = dayData.minTemp; const minHum = dayData.minHum;
                     if (dayData.precip > ALERT_THRESHOLDS.RAIN_LIMIT) { alertsByMonth[month].push({type: 'rain', date: dayData.date, icon: '🌧️', title: 'Chuva Volumosa', description: `Acumulado de <strong>${fNum(dayData.precip)} mm</strong> no dia.`, station: dayData.station }); }
                     if (maxGust > ALERT_THRESHOLDS.GUST_LIMIT) { alertsByMonth[month].push({type: 'gust', date: dayData.date, icon: '💨', title: 'Rajada de Vento Forte', description: `Rajada máxima de <strong>${fNum(maxGust,0)} km/h</strong> registrada.`, station: dayData.station}); }
                     if (maxTemp > ALERT_THRESHOLDS.TEMP_HIGH) { alertsByMonth[month].push({type: 'temp_high', date: dayData.date, icon: '🌡️', title: 'Temperatura Alta', description: `Máxima de <strong>${fNum(maxTemp)} °C</strong> registrada.`, station: dayData.station}); }
                     if (minTemp < ALERT_THRESHOLDS.TEMP_LOW) { alertsByMonth[month].push({type: 'temp_low', date: dayData.date, icon: '🧊', title: 'Temperatura Baixa', description: `Mínima de <strong>${fNum(minTemp)} °C</strong> registrada.`, station: dayData.station}); }
                     if (minHum < ALERT_THRESHOLDS.HUM_LOW) { alertsByMonth[month].push({type: 'hum_low', date: dayData.date, icon: '💧', title: 'Umidade Baixa', description: `Umidade relativa mínima de <strong>${fNum(minHum,0)}%</strong>.`, station: dayData.station}); }
-                }
+                });
                 const container = document.getElementById('historical-alerts-container'); container.innerHTML = '';
                 const sortedMonths = Object.keys(alertsByMonth).sort().reverse();
                 if (sortedMonths.length === 0) { container.innerHTML = '<div class="alert-section"><h2>Alertas Históricos</h2><p style="text-align:center; padding: 20px;">Nenhum alerta climatológico significativo encontrado para o período selecionado.</p></div>'; return; }
@@ -614,7 +1312,12 @@ class RelatorioClimaCompleto:
                 finalHtml += '</div></div>'; container.innerHTML = finalHtml;
             }
             Chart.getSpacedColors = function(count) { const colors = []; for (let i = 0; i < count; i++) { const hue = (360 / count) * i; colors.push(`hsl(${hue}, 70%, 60%)`); } return colors; };
-            iniciarDashboard();
+            // No modo servidor o HTML não traz as linhas horárias: estações e período vêm do servidor local
+            if (AGG_SERVER_URL !== null) {
+                Promise.all([consultarServidor('estacoes', {}), consultarServidor('periodo', {})]).then(([estacoes, periodo]) => iniciarDashboard(estacoes, new Date(periodo.inicio + 'T00:00:00Z'), new Date(periodo.fim + 'T00:00:00Z'))).catch(e => console.error(e));
+            } else {
+                iniciarDashboard([...new Set(allData.map(d => d.nome_estacao))], new Date(Math.min(...allData.map(d=>d.datetime))), new Date(Math.max(...allData.map(d=>d.datetime))));
+            }
         });
     </script>
 </body>
@@ -625,6 +1328,9 @@ class RelatorioClimaCompleto:
         html_final = html_final.replace('__JSON_DATA__', json_data)
         html_final = html_final.replace('__GEODATA__', json_geodata)
         html_final = html_final.replace('__JSON_ALL_FORECASTS__', json_all_forecasts)
+        html_final = html_final.replace('__AGG_SERVER_URL__', json_agg_server_url)
+        html_final = html_final.replace('__JSON_SPRAY_STATS__', json_spray_stats)
+        html_final = html_final.replace('__JSON_HISTORICO_CAMADAS__', json_historico_camadas)
         
         output_dir = "dist"
         os.makedirs(output_dir, exist_ok=True)
@@ -634,8 +1340,9 @@ class RelatorioClimaCompleto:
             f.write(html_final)
         
         print(f"\nRelatório '{filename}' gerado com sucesso!")
+        return filename
 
-    def gerar_relatorio_unico(self):
+    def gerar_relatorio_unico(self, servir: bool = False):
         grower_name = self.grower_name_cache[self.target_grower_id]
         print(f"\n--- Iniciando Relatório para Cliente: {grower_name} (ID: {self.target_grower_id}) ---")
         
@@ -656,27 +1363,37 @@ class RelatorioClimaCompleto:
                     print(f"AVISO: Estação '{station_name}' não possui coordenadas válidas.")
         
         end_date_dt = datetime.now() - timedelta(days=1)
-        start_date_dt = end_date_dt - timedelta(days=365 * ANOS_DE_HISTORICO)
+        if self.cassete is not None:
+            # Reproduções usam a mesma data da gravação para pedir exatamente as mesmas URLs
+            data_gravada = self.cassete.metadados.setdefault('data_final', end_date_dt.strftime('%Y-%m-%d %H:%M:%S'))
+            end_date_dt = datetime.strptime(data_gravada, '%Y-%m-%d %H:%M:%S')
+        historico_camadas = None
+        if self.retencao_em_camadas:
+            # Só os meses recentes ficam horários; o restante vem das camadas congeladas
+            start_date_dt = (end_date_dt - pd.DateOffset(months=MESES_RESOLUCAO_HORARIA)).to_pydatetime()
+            historico_camadas = self.gerar_historico_em_camadas(start_date_dt, end_date_dt)
+        else:
+            start_date_dt = end_date_dt - timedelta(days=365 * ANOS_DE_HISTORICO)
         start_date = start_date_dt.strftime('%Y-%m-%d')
         end_date = end_date_dt.strftime('%Y-%m-%d')
         
-        print(f"\nPeríodo de dados históricos: {start_date} a {end_date} ({ANOS_DE_HISTORICO} anos)")
+        print(f"\nPeríodo de dados horários: {start_date} a {end_date}")
 
-        all_dfs = []
-        for station in self.stations_info:
-            station_id = station['id_estacao']
-            station_name = station.get('name', f"ID {station_id}")
-            raw_data = self.buscar_dados_climaticos(station_id, start_date, end_date)
-            if raw_data:
-                df_station = self.processar_para_dataframe(raw_data, station_id, station_name)
-                all_dfs.append(df_station)
+        # Download e processamento sobrepostos (ver buscar_e_processar_em_pipeline)
+        por_estacao, _ = self.buscar_e_processar_em_pipeline(self.stations_info, start_date, end_date)
+        all_dfs = [por_estacao[s['id_estacao']] for s in self.stations_info if s['id_estacao'] in por_estacao]
 
         if not all_dfs:
             print("\nAVISO: Nenhum dado climático foi encontrado para as estações deste cliente.")
             df_completo = pd.DataFrame()
         else:
             df_completo = pd.concat(all_dfs, ignore_index=True)
+            if historico_camadas is not None:
+                # As primeiras horas do download caem no dia anterior (ajuste de fuso), já coberto pela camada diária
+                inicio_parede = start_date_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+                df_completo = df_completo[df_completo['datetime'].dt.tz_localize(None) >= inicio_parede].reset_index(drop=True)
             print(f"\nTotal de {len(df_completo)} registros horários processados.")
+            self.relatorio_memoria(df_completo)
         
         geodata = {
             'grower_name': grower_name, 
@@ -684,8 +1401,18 @@ class RelatorioClimaCompleto:
             'stations': self.stations_info
         }
         
+        spray_stats = self.calcular_estatisticas_pulverizacao(df_completo, all_forecasts, historico_camadas)
+
         # Remoção da predição: chama gerar_html_final apenas com os dados reais e previsão
-        self.gerar_html_final(df_completo, geodata, all_forecasts)
+        if not servir:
+            self.gerar_html_final(df_completo, geodata, all_forecasts, spray_stats, historico_camadas)
+            return
+
+        # Modo servidor: o dashboard consulta as agregações por intervalo no servidor local
+        html_path = self.gerar_html_final(df_completo, geodata, all_forecasts, spray_stats, historico_camadas, agg_server_url="")
+        classes = None if df_completo.empty else self._classificar_pulverizacao(df_completo['vento_medio_kph'], df_completo['delta_t'])
+        agregador = AgregadorEstacaoDia(df_completo, classes, len(CONDICOES_PULVERIZACAO))
+        iniciar_servidor_local(agregador, html_path, HOST_SERVIDOR_LOCAL, PORTA_SERVIDOR_LOCAL)
 
 
 # ============================================================================
@@ -695,22 +1422,50 @@ if __name__ == "__main__":
     print("Iniciando o script de geração de relatório...")
     
     try:
-        print("Iniciando autenticação via farm_auth...")
-        sessao_autenticada = get_authenticated_session()
-        
-        if not sessao_autenticada:
-            print("❌ ERRO CRÍTICO: Falha na autenticação. Encerrando.")
-            sys.exit(1) 
-        print("Autenticação principal bem-sucedida.")
+        usar_camadas = RETENCAO_EM_CAMADAS or "--camadas" in sys.argv
+        if usar_camadas and not (0 < MESES_RESOLUCAO_HORARIA < 12 * ANOS_RESOLUCAO_DIARIA < 12 * ANOS_DE_HISTORICO):
+            print("❌ ERRO DE CONFIGURAÇÃO: a retenção em camadas exige")
+            print("   0 < MESES_RESOLUCAO_HORARIA < 12 * ANOS_RESOLUCAO_DIARIA < 12 * ANOS_DE_HISTORICO.")
+            print(f"   Atual: {MESES_RESOLUCAO_HORARIA} meses horários, {ANOS_RESOLUCAO_DIARIA} ano(s) diários, {ANOS_DE_HISTORICO} ano(s) de histórico.")
+            sys.exit(1)
+
+        modo_cassete = "gravar" if "--gravar" in sys.argv else "reproduzir" if "--reproduzir" in sys.argv else MODO_CASSETE
+        cassete = None
+
+        if modo_cassete == "reproduzir":
+            print(f"Modo reprodução: usando respostas gravadas em '{ARQUIVO_CASSETE}' (sem rede).")
+            cassete = CasseteHTTP.carregar(ARQUIVO_CASSETE)
+            sessao_autenticada = cassete.criar_sessao_replay(LATENCIA_REPLAY_SEGUNDOS)
+        else:
+            print("Iniciando autenticação via farm_auth...")
+            sessao_autenticada = get_authenticated_session()
+            
+            if not sessao_autenticada:
+                print("❌ ERRO CRÍTICO: Falha na autenticação. Encerrando.")
+                sys.exit(1) 
+            print("Autenticação principal bem-sucedida.")
+
+            if modo_cassete == "gravar":
+                # Instrumentado só após o login: a página de login e a senha não vão para o cassete
+                cassete = CasseteHTTP(ARQUIVO_CASSETE)
+                cassete.instrumentar(sessao_autenticada)
         
         analisador = RelatorioClimaCompleto(
             grower_id=CLIENTE_ID,
             grower_name=CLIENTE_NOME,
             stations=ESTACOES_DO_CLIENTE,
-            session=sessao_autenticada
+            session=sessao_autenticada,
+            compacto=MODO_MEMORIA_COMPACTA or "--compacto" in sys.argv,
+            camadas=usar_camadas,
+            cassete=cassete
         )
         
-        analisador.gerar_relatorio_unico()
+        try:
+            analisador.gerar_relatorio_unico(servir=MODO_SERVIDOR_LOCAL or "--servir" in sys.argv)
+        finally:
+            # Grava o cassete mesmo se a geração falhar no meio
+            if modo_cassete == "gravar" and cassete is not None:
+                cassete.salvar()
         
         print("\n--- Geração de Relatório Concluída com Sucesso ---")
         
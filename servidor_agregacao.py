@@ -0,0 +1,360 @@
+# Nome do arquivo: servidor_agregacao.py
+# (Servidor local de agregações para o dashboard)
+
+import json
+import os
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+# Agregação padrão de cada métrica (espelha o 'mapMetricsConfig' do dashboard)
+AGREGACAO_PADRAO = {
+    'precipitacao_mm': 'sum',
+    'radiacao_solar': 'sum',
+    'temp_media_c': 'avg',
+    'umidade_media_perc': 'avg',
+    'vento_medio_kph': 'avg',
+    'delta_t': 'avg',
+    'gfdi': 'avg',
+    'temp_max_c': 'max',
+    'umidade_max_perc': 'max',
+    'rajada_max_kph': 'max',
+    'temp_min_c': 'min',
+    'umidade_min_perc': 'min',
+}
+
+# Métricas com perfil por hora do dia no dashboard (vento/Delta T, GFDI e radiação)
+METRICAS_PERFIL_HORARIO = ('vento_medio_kph', 'delta_t', 'gfdi', 'radiacao_solar')
+
+# Métricas da série diária enviadas também por estação (chuva por estação e alertas históricos)
+METRICAS_POR_ESTACAO = ('precipitacao_mm', 'rajada_max_kph', 'temp_max_c', 'temp_min_c', 'umidade_min_perc')
+
+# Faixas de velocidade da rosa dos ventos (espelha 'speedBrackets' do dashboard). Além delas, a
+# contagem por direção guarda 'acima da última faixa' e 'sem velocidade' (entram só nos totais)
+FAIXAS_VELOCIDADE_VENTO = (0, 3, 6, 9, 100)
+N_DIRECOES = 16
+
+
+class AgregadorEstacaoDia:
+    """
+    Mantém em memória um rollup estação x dia dos dados horários já
+    processados e responde consultas de intervalo em tempo constante.
+
+    Para 'sum' e 'avg' são usados vetores de soma acumulada (soma e
+    contagem), de modo que o total de qualquer intervalo de dias é
+    obtido com uma subtração. 'max'/'min' varrem apenas o recorte diário.
+
+    Os gráficos por hora do dia, a rosa dos ventos e as condições de
+    pulverização usam rollups estação x dia x hora (ou x direção/condição),
+    somados só sobre o recorte pedido. As linhas horárias só são enviadas
+    em '/horario' (detalhe de um dia, radiação hora a hora).
+    'classes_pulverizacao' são os índices de CONDICOES_PULVERIZACAO de cada linha.
+    """
+
+    def __init__(self, df: pd.DataFrame, classes_pulverizacao: np.ndarray | None = None, n_condicoes: int = 4):
+        self.estacoes = []
+        self.dias = np.array([], dtype='datetime64[D]')
+        self.metricas = [m for m in AGREGACAO_PADRAO if m in df.columns]
+        self._soma_acc = {}
+        self._contagem_acc = {}
+        self._max_dia = {}
+        self._min_dia = {}
+        self._soma_hora = {}
+        self._contagem_hora = {}
+        self._df = df
+        if df.empty: return
+
+        # Horário de parede, como o dashboard exibe
+        horario = df['datetime'].dt.tz_localize(None) if df['datetime'].dt.tz is not None else df['datetime']
+        dia = horario.dt.floor('D')
+        self.estacoes = sorted(df['nome_estacao'].astype(str).unique())
+        self.dias = np.arange(dia.min().to_datetime64().astype('datetime64[D]'),
+                              dia.max().to_datetime64().astype('datetime64[D]') + np.timedelta64(1, 'D'))
+
+        idx_estacao = pd.Categorical(df['nome_estacao'].astype(str), categories=self.estacoes).codes
+        idx_dia = (dia.values.astype('datetime64[D]') - self.dias[0]).astype(np.int64)
+        hora = horario.dt.hour.to_numpy()
+        forma = (len(self.estacoes), len(self.dias))
+
+        self._linhas_dia = np.zeros(forma, dtype=np.int32)
+        np.add.at(self._linhas_dia, (idx_estacao, idx_dia), 1)
+        # Linhas ordenadas por dia: '/horario' recorta um intervalo com searchsorted
+        self._ordem = np.argsort(idx_dia, kind='stable')
+        self._dia_ordenado = idx_dia[self._ordem]
+        self._horario = horario
+
+        for metrica in self.metricas:
+            valores = pd.to_numeric(df[metrica], errors='coerce').to_numpy(dtype=np.float64)
+            validos = ~np.isnan(valores)
+            e, d, v = idx_estacao[validos], idx_dia[validos], valores[validos]
+
+            soma = np.zeros(forma)
+            contagem = np.zeros(forma)
+            np.add.at(soma, (e, d), v)
+            np.add.at(contagem, (e, d), 1)
+            # Coluna de zeros à esquerda: total de [i, j] = acc[j + 1] - acc[i]
+            self._soma_acc[metrica] = np.concatenate([np.zeros((forma[0], 1)), np.cumsum(soma, axis=1)], axis=1)
+            self._contagem_acc[metrica] = np.concatenate([np.zeros((forma[0], 1)), np.cumsum(contagem, axis=1)], axis=1)
+
+            maximo = np.full(forma, -np.inf)
+            minimo = np.full(forma, np.inf)
+            np.maximum.at(maximo, (e, d), v)
+            np.minimum.at(minimo, (e, d), v)
+            self._max_dia[metrica] = maximo
+            self._min_dia[metrica] = minimo
+
+            if metrica in METRICAS_PERFIL_HORARIO:
+                soma_hora = np.zeros(forma + (24,))
+                contagem_hora = np.zeros(forma + (24,), dtype=np.int32)
+                np.add.at(soma_hora, (e, d, hora[validos]), v)
+                np.add.at(contagem_hora, (e, d, hora[validos]), 1)
+                self._soma_hora[metrica] = soma_hora
+                self._contagem_hora[metrica] = contagem_hora
+
+        # Direção x faixa de velocidade (mesma regra do degreesToCardinal / rosa dos ventos do dashboard)
+        self._direcao_velocidade = np.zeros(forma + (N_DIRECOES, len(FAIXAS_VELOCIDADE_VENTO) + 1), dtype=np.int32)
+        if 'vento_direcao_graus' in df.columns and 'vento_medio_kph' in df.columns:
+            graus = pd.to_numeric(df['vento_direcao_graus'], errors='coerce').to_numpy(dtype=np.float64)
+            # No JSON do dashboard a velocidade ausente vira null, que entra como 0 na rosa
+            velocidade = np.nan_to_num(pd.to_numeric(df['vento_medio_kph'], errors='coerce').to_numpy(dtype=np.float64), nan=0.0)
+            com_direcao = ~np.isnan(graus) & (graus >= 0)
+            direcao = (np.floor(graus[com_direcao] / 22.5 + 0.5) % N_DIRECOES).astype(np.int64)
+            v = velocidade[com_direcao]
+            faixa = np.searchsorted(FAIXAS_VELOCIDADE_VENTO, v, side='right') - 1
+            faixa = np.where(v < 0, len(FAIXAS_VELOCIDADE_VENTO), faixa)
+            np.add.at(self._direcao_velocidade, (idx_estacao[com_direcao], idx_dia[com_direcao], direcao, faixa), 1)
+
+        self._pulverizacao_dia = np.zeros(forma + (n_condicoes,), dtype=np.int32)
+        if classes_pulverizacao is not None:
+            np.add.at(self._pulverizacao_dia, (idx_estacao, idx_dia, np.asarray(classes_pulverizacao, dtype=np.int64)), 1)
+
+        print(f"Rollup estação x dia: {forma[0]} estações x {forma[1]} dias, {len(self.metricas)} métricas.")
+
+    def _indices_intervalo(self, inicio: str, fim: str) -> tuple[int, int]:
+        ini = np.datetime64(inicio, 'D') if inicio else self.dias[0]
+        fi = np.datetime64(fim, 'D') if fim else self.dias[-1]
+        i = int(np.searchsorted(self.dias, ini, side='left'))
+        j = int(np.searchsorted(self.dias, fi, side='right')) - 1
+        return i, j
+
+    def _linhas_estacao(self, estacao: str) -> list:
+        if estacao in (None, '', 'todas'): return list(range(len(self.estacoes)))
+        if estacao in self.estacoes: return [self.estacoes.index(estacao)]
+        raise ValueError(f"Estação desconhecida: {estacao}")
+
+    def consultar(self, metrica: str, inicio: str = None, fim: str = None, estacao: str = 'todas', agg: str = None) -> dict:
+        if metrica not in self.metricas:
+            raise ValueError(f"Métrica desconhecida: {metrica}")
+        agg = agg or AGREGACAO_PADRAO[metrica]
+        if agg not in ('sum', 'avg', 'max', 'min'):
+            raise ValueError(f"Agregação desconhecida: {agg}")
+
+        linhas = self._linhas_estacao(estacao)
+
+        resultado = {}
+        if len(self.dias) == 0: return resultado
+        i, j = self._indices_intervalo(inicio, fim)
+        if j < i: return resultado
+
+        for linha in linhas:
+            n = self._contagem_acc[metrica][linha, j + 1] - self._contagem_acc[metrica][linha, i]
+            if n == 0: continue
+            if agg in ('sum', 'avg'):
+                total = self._soma_acc[metrica][linha, j + 1] - self._soma_acc[metrica][linha, i]
+                valor = total if agg == 'sum' else total / n
+            elif agg == 'max':
+                valor = self._max_dia[metrica][linha, i:j + 1].max()
+            else:
+                valor = self._min_dia[metrica][linha, i:j + 1].min()
+            resultado[self.estacoes[linha]] = {'valor': float(valor), 'n': int(n)}
+        return resultado
+
+    def consultar_estacoes(self, inicio: str = None, fim: str = None, estacao: str = 'todas') -> dict:
+        """Todas as métricas de cada estação no intervalo: {estacao: {metrica: {'valor', 'n'}}}."""
+        resultado = {}
+        for metrica in self.metricas:
+            for nome, valor in self.consultar(metrica, inicio, fim, estacao).items():
+                resultado.setdefault(nome, {})[metrica] = valor
+        return resultado
+
+    def serie_diaria(self, inicio: str = None, fim: str = None, estacao: str = 'todas', periodo: str = 'dia') -> dict:
+        """
+        Série por dia ('dia') ou por mês ('mes') das estações selecionadas, só com os
+        períodos que têm dados. 'combinado' junta as estações com a agregação padrão de
+        cada métrica; 'n' é o número de horas válidas (peso das médias);
+        'por_estacao' traz METRICAS_POR_ESTACAO separadas; 'pulverizacao' conta as
+        horas por condição.
+        """
+        if periodo not in ('dia', 'mes'):
+            raise ValueError(f"Período desconhecido: {periodo}")
+        linhas = self._linhas_estacao(estacao)
+        resultado = {'datas': [], 'estacoes': [], 'combinado': {}, 'n': {}, 'por_estacao': {}, 'pulverizacao': []}
+        if len(self.dias) == 0: return resultado
+        i, j = self._indices_intervalo(inicio, fim)
+        if j < i: return resultado
+
+        com_dados = self._linhas_dia[linhas, i:j + 1] > 0
+        dias_validos = com_dados.any(axis=0)
+        dias = self.dias[i:j + 1][dias_validos]
+        if periodo == 'mes': dias = dias.astype('datetime64[M]')
+        rotulos, grupo = np.unique(dias.astype(str), return_inverse=True)
+        forma = (len(linhas), len(rotulos))
+
+        def agrupar(valores, ufunc, inicial):
+            saida = np.full(forma, inicial, dtype=np.float64)
+            ufunc.at(saida, (slice(None), grupo), valores[:, dias_validos])
+            return saida
+
+        def lista(valores, validos):
+            return [float(v) if ok else None for v, ok in zip(np.round(valores, 2), validos)]
+
+        for metrica in self.metricas:
+            agg = AGREGACAO_PADRAO[metrica]
+            contagem = agrupar(np.diff(self._contagem_acc[metrica][linhas, i:j + 2], axis=1), np.add, 0)
+            if agg in ('sum', 'avg'):
+                soma = agrupar(np.diff(self._soma_acc[metrica][linhas, i:j + 2], axis=1), np.add, 0)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    por_estacao = soma if agg == 'sum' else soma / contagem
+                    combinado = soma.sum(axis=0) if agg == 'sum' else soma.sum(axis=0) / contagem.sum(axis=0)
+            elif agg == 'max':
+                por_estacao = agrupar(self._max_dia[metrica][linhas, i:j + 1], np.maximum, -np.inf)
+                combinado = por_estacao.max(axis=0)
+            else:
+                por_estacao = agrupar(self._min_dia[metrica][linhas, i:j + 1], np.minimum, np.inf)
+                combinado = por_estacao.min(axis=0)
+
+            n_total = contagem.sum(axis=0)
+            resultado['combinado'][metrica] = lista(combinado, n_total > 0)
+            resultado['n'][metrica] = n_total.astype(int).tolist()
+            if metrica in METRICAS_POR_ESTACAO:
+                resultado['por_estacao'][metrica] = {self.estacoes[linha]: lista(por_estacao[k], contagem[k] > 0)
+                                                     for k, linha in enumerate(linhas) if com_dados[k].any()}
+
+        pulverizacao = np.zeros((len(rotulos), self._pulverizacao_dia.shape[-1]), dtype=np.int64)
+        np.add.at(pulverizacao, grupo, self._pulverizacao_dia[linhas, i:j + 1].sum(axis=0)[dias_validos])
+        resultado['datas'] = rotulos.tolist()
+        resultado['estacoes'] = [self.estacoes[linha] for k, linha in enumerate(linhas) if com_dados[k].any()]
+        resultado['pulverizacao'] = pulverizacao.tolist()
+        return resultado
+
+    def perfil_horario(self, inicio: str = None, fim: str = None, estacao: str = 'todas', metricas: list | None = None) -> dict:
+        """Média por hora do dia de METRICAS_PERFIL_HORARIO e contagem direção x faixa de velocidade do vento."""
+        metricas = metricas or [m for m in METRICAS_PERFIL_HORARIO if m in self._soma_hora]
+        for metrica in metricas:
+            if metrica not in self._soma_hora:
+                raise ValueError(f"Métrica sem perfil horário: {metrica}")
+        linhas = self._linhas_estacao(estacao)
+        resultado = {'media_hora': {m: [None] * 24 for m in metricas},
+                     'direcao_velocidade': np.zeros((N_DIRECOES, len(FAIXAS_VELOCIDADE_VENTO) + 1), dtype=int).tolist()}
+        if len(self.dias) == 0: return resultado
+        i, j = self._indices_intervalo(inicio, fim)
+        if j < i: return resultado
+
+        for metrica in metricas:
+            soma = self._soma_hora[metrica][linhas, i:j + 1].sum(axis=(0, 1))
+            contagem = self._contagem_hora[metrica][linhas, i:j + 1].sum(axis=(0, 1))
+            resultado['media_hora'][metrica] = [round(float(s / c), 3) if c else None for s, c in zip(soma, contagem)]
+        resultado['direcao_velocidade'] = self._direcao_velocidade[linhas, i:j + 1].sum(axis=(0, 1)).tolist()
+        return resultado
+
+    def horario(self, inicio: str = None, fim: str = None, estacao: str = 'todas', colunas: list | None = None) -> dict:
+        """Linhas horárias do intervalo (horário de parede em ISO 'Z', como no JSON embutido do dashboard)."""
+        if len(self.dias) == 0: return {'colunas': [], 'linhas': []}
+        colunas = colunas or [c for c in self._df.columns if c not in ('datetime', 'nome_estacao', 'station_id')]
+        desconhecidas = [c for c in colunas if c not in self._df.columns or c in ('datetime', 'nome_estacao')]
+        if desconhecidas:
+            raise ValueError(f"Colunas desconhecidas: {', '.join(desconhecidas)}")
+        linhas = self._linhas_estacao(estacao)
+        i, j = self._indices_intervalo(inicio, fim)
+        a = int(np.searchsorted(self._dia_ordenado, i, side='left'))
+        b = int(np.searchsorted(self._dia_ordenado, j, side='right'))
+        posicoes = self._ordem[a:b]
+
+        recorte = self._df.iloc[posicoes]
+        if len(linhas) < len(self.estacoes):
+            manter = recorte['nome_estacao'].astype(str).to_numpy() == self.estacoes[linhas[0]]
+            recorte, posicoes = recorte[manter], posicoes[manter]
+        saida = pd.DataFrame({'datetime': self._horario.iloc[posicoes].dt.strftime('%Y-%m-%dT%H:%M:%S.000Z').to_numpy(),
+                              'nome_estacao': recorte['nome_estacao'].astype(str).to_numpy()})
+        for coluna in colunas:
+            saida[coluna] = pd.to_numeric(recorte[coluna], errors='coerce').round(3).to_numpy(dtype=np.float64)
+        saida = saida.sort_values(['datetime', 'nome_estacao'], kind='stable')
+        return {'colunas': list(saida.columns), 'linhas': json.loads(saida.to_json(orient='values'))}
+
+
+def _criar_handler(agregador: AgregadorEstacaoDia, html_path: str | None):
+    class HandlerAgregacao(BaseHTTPRequestHandler):
+        def _responder(self, status: int, corpo: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _responder_json(self, status: int, payload):
+            self._responder(status, json.dumps(payload).encode('utf-8'), 'application/json; charset=utf-8')
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            if url.path in ('/', '/index.html'):
+                if not html_path or not os.path.exists(html_path):
+                    return self._responder_json(404, {'erro': 'Relatório HTML não encontrado.'})
+                with open(html_path, 'rb') as f:
+                    return self._responder(200, f.read(), 'text/html; charset=utf-8')
+
+            if url.path == '/estacoes':
+                return self._responder_json(200, agregador.estacoes)
+
+            if url.path == '/metricas':
+                return self._responder_json(200, {m: AGREGACAO_PADRAO[m] for m in agregador.metricas})
+
+            if url.path == '/periodo':
+                datas = agregador.dias.astype(str)
+                return self._responder_json(200, {'inicio': datas[0] if len(datas) else None, 'fim': datas[-1] if len(datas) else None})
+
+            # Consultas por intervalo: todas aceitam 'inicio', 'fim' (AAAA-MM-DD) e 'estacao'
+            intervalo = {'inicio': params.get('inicio'), 'fim': params.get('fim'), 'estacao': params.get('estacao', 'todas')}
+            consultas = {
+                '/agregado': lambda: agregador.consultar(metrica=params.get('metrica', ''), agg=params.get('agg'), **intervalo),
+                '/agregado_estacoes': lambda: agregador.consultar_estacoes(**intervalo),
+                '/serie_diaria': lambda: agregador.serie_diaria(periodo=params.get('periodo', 'dia'), **intervalo),
+                '/perfil_horario': lambda: agregador.perfil_horario(metricas=params['metricas'].split(',') if params.get('metricas') else None, **intervalo),
+                '/horario': lambda: agregador.horario(colunas=params['colunas'].split(',') if params.get('colunas') else None, **intervalo),
+            }
+            if url.path in consultas:
+                try:
+                    resultado = consultas[url.path]()
+                except ValueError as e:
+                    return self._responder_json(400, {'erro': str(e)})
+                return self._responder_json(200, resultado)
+
+            self._responder_json(404, {'erro': f"Rota desconhecida: {url.path}"})
+
+        def log_message(self, format, *args):
+            print(f" -> [servidor] {self.address_string()} {format % args}")
+
+    return HandlerAgregacao
+
+
+def iniciar_servidor_local(agregador: AgregadorEstacaoDia, html_path: str | None, host: str, porta: int):
+    """
+    Sobe o servidor HTTP local (bloqueante) que entrega o dashboard em '/'
+    e responde as consultas por intervalo ('/agregado', '/agregado_estacoes',
+    '/serie_diaria', '/perfil_horario', '/horario'). O dashboard é servido pela
+    mesma origem, então não há cabeçalhos CORS.
+    Roda totalmente offline, pensado para a máquina do escritório da fazenda.
+    """
+    servidor = ThreadingHTTPServer((host, porta), _criar_handler(agregador, html_path))
+    print(f"\n--- Servidor local de agregação ativo em http://{host}:{porta}/ (Ctrl+C para encerrar) ---")
+    print(f"    Iniciado em {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor local encerrado.")
+    finally:
+        servidor.server_close()